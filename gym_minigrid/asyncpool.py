@@ -0,0 +1,167 @@
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import gym
+
+class AsyncMiniGridPool:
+    """
+    Asyncio facade over a pool of environments.
+
+    Coroutines call `await pool.step(env_idx, action)` and
+    `await pool.reset(env_idx)` without blocking the event loop. Requests
+    made while the previous batch is running are queued, and coalesced
+    into a single batch executed on a worker thread. Requests to the same
+    environment are executed in the order they were made.
+
+    The batches run in the process of the pool, so the executor must be a
+    thread executor: the environments can't be sent to a process executor.
+    """
+
+    def __init__(
+        self,
+        env_name,
+        num_envs,
+        seed=1337,
+        max_batch_size=None,
+        executor=None
+    ):
+        if callable(env_name):
+            self.envs = [env_name() for i in range(num_envs)]
+        else:
+            self.envs = [gym.make(env_name) for i in range(num_envs)]
+        self.num_envs = num_envs
+
+        for idx, env in enumerate(self.envs):
+            env.seed(seed + idx)
+
+        env = self.envs[0]
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+        self.reward_range = env.reward_range
+
+        # Maximum number of requests executed in one batch (no limit if None)
+        self.max_batch_size = max_batch_size
+
+        # The environments are not thread-safe, so the default executor
+        # runs the batches one at a time
+        assert not isinstance(executor, ProcessPoolExecutor), \
+            "process executors are not supported"
+        self.executor = executor
+        self.own_executor = executor is None
+        if self.own_executor:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+        # Requests waiting to be executed, as (env_idx, cmd, arg, future)
+        self.queue = []
+        self.dispatching = False
+
+        # Statistics on the batches executed
+        self.num_requests = 0
+        self.num_batches = 0
+        self.batch_sizes = Counter()
+
+    async def step(self, env_idx, action):
+        """
+        Step one environment, returning (obs, reward, done, info)
+        """
+
+        return await self._submit(env_idx, 'step', action)
+
+    async def reset(self, env_idx):
+        """
+        Reset one environment, returning its first observation
+        """
+
+        return await self._submit(env_idx, 'reset', None)
+
+    def _submit(self, env_idx, cmd, arg):
+        assert env_idx >= 0 and env_idx < self.num_envs
+
+        future = asyncio.get_event_loop().create_future()
+        self.queue.append((env_idx, cmd, arg, future))
+
+        # Start a dispatcher, which runs once the other coroutines ready to
+        # run have had a chance to queue their requests
+        if not self.dispatching:
+            self.dispatching = True
+            asyncio.ensure_future(self._dispatch())
+
+        return future
+
+    async def _dispatch(self):
+        loop = asyncio.get_event_loop()
+
+        try:
+            while len(self.queue) > 0:
+                size = len(self.queue)
+                if self.max_batch_size is not None:
+                    size = min(size, self.max_batch_size)
+                batch = self.queue[:size]
+                del self.queue[:size]
+
+                self.num_requests += size
+                self.num_batches += 1
+                self.batch_sizes[size] += 1
+
+                requests = [(env_idx, cmd, arg) for env_idx, cmd, arg, _ in batch]
+                try:
+                    results = await loop.run_in_executor(self.executor, self._run_batch, requests)
+                except Exception as e:
+                    # The batch could not be executed (eg: the executor was
+                    # shut down), fail it along with the queued requests
+                    batch += self.queue
+                    del self.queue[:]
+                    for _, _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    return
+
+                for (_, _, _, future), (error, result) in zip(batch, results):
+                    if future.cancelled():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+        finally:
+            self.dispatching = False
+
+    def _run_batch(self, requests):
+        """
+        Execute a batch of requests, on the worker thread
+        """
+
+        results = []
+
+        for env_idx, cmd, arg in requests:
+            env = self.envs[env_idx]
+            try:
+                if cmd == 'step':
+                    results.append((None, env.step(arg)))
+                else:
+                    results.append((None, env.reset()))
+            except Exception as e:
+                results.append((e, None))
+
+        return results
+
+    def stats(self):
+        """
+        Get the current queue depth and statistics on the batch sizes
+        """
+
+        return {
+            'queue_depth': len(self.queue),
+            'num_requests': self.num_requests,
+            'num_batches': self.num_batches,
+            'mean_batch_size': self.num_requests / max(self.num_batches, 1),
+            'max_batch_size': max(self.batch_sizes, default=0),
+            'batch_sizes': dict(self.batch_sizes)
+        }
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown()
+        for env in self.envs:
+            env.close()
@@ -1,6 +1,5 @@
 from gym_minigrid.miniblocks import *
 from gym_minigrid.register import register
-import numpy.random as rand
 
 #####################################
 # Basic maze environment generation #
@@ -12,6 +11,8 @@ class BlockMazeEnv(MiniBlocksEnv):
     Block goal in one room, agent starts in another room
     """
 
+    level_attrs = MiniBlocksEnv.level_attrs + ('d1',)
+
     def __init__(self, size=16):
         super().__init__(
             grid_size=size,
@@ -26,14 +27,14 @@ class BlockMazeEnv(MiniBlocksEnv):
         # the same seed before calling env.reset()
 
         #Pick dimensions of the rooms. Somewhere between 5 and 7
-        d1 = 5+rand.randint(2)
-        d2 = 5+rand.randint(2)
-        offset = rand.randint(2)
+        d1 = 5+self._rand_int(0, 2)
+        d2 = 5+self._rand_int(0, 2)
+        offset = self._rand_int(0, 2)
         rotate = 0
-        #rotate = rand.randint(4)
+        #rotate = self._rand_int(0, 4)
         #Choose goal location in room 2
-        bx, by = 2+rand.randint(d1-4), 2+rand.randint(d1-4)
-        gx, gy = d1+rand.randint(d2-2), offset+1+rand.randint(d2-2)
+        bx, by = 2+self._rand_int(0, d1-4), 2+self._rand_int(0, d1-4)
+        gx, gy = d1+self._rand_int(0, d2-2), offset+1+self._rand_int(0, d2-2)
         # Create an empty grids
         d3 = d1+d2
         #print(d1-1, offset, d1+d2-1, offset+d2, 'width', width, 'height', height)
@@ -58,7 +59,7 @@ class BlockMazeEnv(MiniBlocksEnv):
         #Door from R1 to R2
         self.grid.set(d1-1,min(offset+2, d1-2),Door('red', True))
         #Place the goals and blocks
-        self.grid.set(gx, gy, VisibleBlockGoal())
+        self.grid.set(gx, gy, VisibleBlockGoal.shared())
         self.grid.set(bx, by, Block())
         #Rotate by some amount
         for i in range(rotate):
@@ -68,7 +69,7 @@ class BlockMazeEnv(MiniBlocksEnv):
         self.start_dir = 0
         self.mission = "push block to goal square"
 
-    def _find_random_startpos(self, num_tries = math.inf):
+    def _find_random_startpos(self, max_tries = math.inf):
 
         rot = self.rotate
         if rot == 1:
@@ -88,7 +89,7 @@ class BlockMazeEnv(MiniBlocksEnv):
         while True:
             # This is to handle with rare cases where rejection sampling
             # gets stuck in an infinite loop
-            if num_tries > num_tries:
+            if num_tries > max_tries:
                 raise RecursionError('rejection sampling failed in place_obj')
             num_tries += 1
             pos = np.array((
@@ -7,6 +7,8 @@ class KeyCorridor(RoomGrid):
     random room.
     """
 
+    level_attrs = ('obj',)
+
     def __init__(
         self,
         num_rows=3,
@@ -7,6 +7,8 @@ class PutNearEnv(MiniGridEnv):
     another object through a natural language string.
     """
 
+    level_attrs = ('move_type', 'moveColor', 'target_pos')
+
     def __init__(
         self,
         size=6,
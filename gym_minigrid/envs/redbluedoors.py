@@ -6,6 +6,8 @@ class RedBlueDoorEnv(MiniGridEnv):
     Empty grid environment, no obstacles, sparse reward
     """
 
+    level_attrs = ('red_door', 'blue_door')
+
     def __init__(self, size=8):
         self.size = size
 
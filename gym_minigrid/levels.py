@@ -0,0 +1,423 @@
+import json
+import queue
+import struct
+import multiprocessing as mp
+
+import numpy as np
+
+from gym_minigrid.minigrid import Grid, WorldObj
+from gym_minigrid.vecenv import _make_proc_env
+
+# Identification and version of the level library file format
+LEVELS_MAGIC = b'MGLEVELS'
+LEVELS_VERSION = 1
+
+# Seconds LevelPool.pop waits for a level before checking that the
+# generator process is still running
+POP_POLL_INTERVAL = 1.0
+
+# Magic, version, number of levels, offset and size of the JSON header.
+# The levels are stored right after it, and the header after the levels.
+_PREAMBLE = struct.Struct('<8sI4xQQQ')
+
+def encode_level(env):
+    """
+    Encode the level generated by the last call to _gen_grid: the grid
+    encoding, including the objects hidden from the agent, the encoding of
+    the objects contained in boxes, the start position and direction, the
+    mission and the attributes named in env.level_attrs
+    """
+
+    grid = env.grid
+    contains = np.zeros(shape=(grid.width, grid.height, 3), dtype='uint8')
+    for j in range(0, grid.height):
+        for i in range(0, grid.width):
+            v = grid.get(i, j)
+            if v is not None and v.contains is not None:
+                assert v.contains.contains is None, 'nested containers'
+                contains[i, j] = v.contains.encode()
+
+    return (
+        grid.encode(render_invisible=True),
+        contains,
+        tuple(int(v) for v in env.start_pos),
+        int(env.start_dir),
+        env.mission,
+        tuple(_encode_value(grid, getattr(env, name)) for name in env.level_attrs)
+    )
+
+def decode_level(env, grid, contains, start_pos, start_dir, mission, attrs):
+    """
+    Load a level encoded by encode_level into an environment, in place of
+    calling _gen_grid. The attributes are (name, value) pairs.
+    """
+
+    grid = Grid.decode(grid)
+    for i, j in zip(*np.nonzero(contains[:, :, 0])):
+        grid.get(i, j).contains = WorldObj.decode(*contains[i, j])
+
+    env.grid = grid
+    env.start_pos = tuple(int(v) for v in start_pos)
+    env.start_dir = int(start_dir)
+    env.mission = mission
+
+    for name, value in attrs:
+        setattr(env, name, _decode_value(grid, value))
+
+def _gen_level(env):
+    """
+    Generate the next level of an environment, encoded
+    """
+
+    env._gen_grid(env.grid_size, env.grid_size)
+    return encode_level(env)
+
+def _gen_worker(env_id, seed, level_queue):
+    """
+    Generator process, queueing levels until it is terminated. Putting a
+    level blocks while the queue is full.
+    """
+
+    env = _make_proc_env(env_id).unwrapped
+    env.seed(seed)
+
+    while True:
+        level_queue.put(_gen_level(env))
+
+class LevelPool:
+    """
+    Pool of levels of an environment, generated in advance by a background
+    process, so that resets don't wait for expensive level generators (eg:
+    MultiRoom, KeyCorridor, ObstructedMaze). Up to size levels are kept
+    ready, encoded by encode_level.
+
+    Levels are generated in order by a single environment seeded with seed,
+    so the sequence of levels only depends on the seed. For environments
+    which generate the whole level in _gen_grid, it is the same as the
+    sequence of grids generated by successive resets of an environment
+    seeded the same way. This is not the case of environments drawing
+    parts of the episode in reset with the RNG of the environment (eg:
+    the start position of the agent in MiniBlocksEnv), since these draws
+    are made by the environment taking the levels.
+
+    When the pool is empty, pop waits for the level being generated, which
+    takes at most the time of a synchronous reset. If the generator process
+    dies, the remaining levels are generated by pop itself, continuing the
+    sequence, and so are all levels with background=False.
+
+    Environments use a pool by setting their level_pool attribute:
+
+        env.level_pool = LevelPool('MiniGrid-MultiRoom-N6-v0', seed=1)
+    """
+
+    def __init__(self, env_id, seed=1337, size=32, background=True):
+        self.env_id = env_id
+        self.seed = seed
+        self.size = size
+
+        # Number of levels taken out of the pool
+        self.num_popped = 0
+
+        self.env = None
+        self.proc = None
+
+        if background:
+            self.queue = mp.Queue(maxsize=size)
+            self.proc = mp.Process(
+                target=_gen_worker,
+                args=(env_id, seed, self.queue),
+                daemon=True
+            )
+            self.proc.start()
+        else:
+            self.env = _make_proc_env(env_id).unwrapped
+            self.env.seed(seed)
+
+        self.closed = False
+
+    def pop(self):
+        """
+        Take the next level out of the pool
+        """
+
+        assert not self.closed, "the level pool is closed"
+
+        while self.proc is not None:
+            try:
+                level = self.queue.get(timeout=POP_POLL_INTERVAL)
+                self.num_popped += 1
+                return level
+            except queue.Empty:
+                if not self.proc.is_alive():
+                    self._stop_worker()
+
+        if self.env is None:
+            # Skip the levels already taken from the dead generator process
+            self.env = _make_proc_env(self.env_id).unwrapped
+            self.env.seed(self.seed)
+            for _ in range(0, self.num_popped):
+                self.env._gen_grid(self.env.grid_size, self.env.grid_size)
+
+        self.num_popped += 1
+        return _gen_level(self.env)
+
+    def load_next(self, env):
+        """
+        Load the next level of the pool into an environment
+        """
+
+        level = self.pop()
+        decode_level(env, *level[:5], zip(env.level_attrs, level[5]))
+
+    def _stop_worker(self):
+        self.proc.terminate()
+        self.proc.join()
+        self.queue.close()
+        self.proc = None
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        if self.proc is not None:
+            self._stop_worker()
+
+def level_dtype(width, height, num_attrs):
+    """
+    Numpy type of the records storing levels in a level library
+    """
+
+    return np.dtype([
+        # Grid encoding, including the objects hidden from the agent
+        ('grid', 'u1', (width, height, 3)),
+        # Encoding of the objects contained in the boxes of the grid
+        ('contains', 'u1', (width, height, 3)),
+        ('start_pos', '<i2', (2,)),
+        ('start_dir', 'u1'),
+        # Index of the mission string in the table of values
+        ('mission', '<u4'),
+        # Indices of the values of the level attributes
+        ('attrs', '<u4', (num_attrs,)),
+        # Seed of the environment which generated the level
+        ('seed', '<u8')
+    ])
+
+def _encode_value(grid, value):
+    """
+    Convert the value of a level attribute to JSON. Objects are stored as
+    the position of the cell containing them.
+    """
+
+    if isinstance(value, WorldObj):
+        for j in range(0, grid.height):
+            for i in range(0, grid.width):
+                v = grid.get(i, j)
+                if v is value:
+                    return {'obj': [i, j]}
+                if v is not None and v.contains is value:
+                    return {'contains': [i, j]}
+        raise ValueError('level attribute object not found in the grid')
+
+    if isinstance(value, (np.ndarray, np.generic)):
+        value = value.tolist()
+    if isinstance(value, (tuple, list)):
+        return [_encode_value(grid, v) for v in value]
+
+    return value
+
+def _decode_value(grid, value):
+    """
+    Convert a value stored by _encode_value back, with lists as tuples
+    """
+
+    if isinstance(value, dict):
+        if 'obj' in value:
+            return grid.get(*value['obj'])
+        return grid.get(*value['contains']).contains
+
+    if isinstance(value, list):
+        return tuple(_decode_value(grid, v) for v in value)
+
+    return value
+
+def write_levels(path, env_id, seeds, chunk_size=1024):
+    """
+    Generate one level per seed, and write them to a level library file.
+    The level generated for a seed is the level of the first episode of a
+    new environment seeded with it.
+    """
+
+    env = _make_proc_env(env_id).unwrapped
+
+    # Objects are not placed on the start position of the previous episode,
+    # which is the one of the episode reset by the constructor for a new
+    # environment
+    first_start_pos = env.start_pos
+    width = height = env.grid_size
+    attr_names = list(env.level_attrs)
+    dtype = level_dtype(width, height, len(attr_names))
+
+    # Distinct values of the missions and attributes, and their indices
+    values = []
+    value_idxs = {}
+
+    def value_idx(value):
+        key = json.dumps(value, sort_keys=True)
+        idx = value_idxs.get(key)
+        if idx is None:
+            idx = value_idxs[key] = len(values)
+            values.append(value)
+        return idx
+
+    num_levels = 0
+    chunk = np.zeros(shape=(chunk_size,), dtype=dtype)
+
+    with open(path, 'wb') as f:
+        f.write(bytes(_PREAMBLE.size))
+
+        for seed in seeds:
+            env.seed(int(seed))
+            env.start_pos = first_start_pos
+            grid, contains, start_pos, start_dir, mission, attrs = _gen_level(env)
+
+            level = chunk[num_levels % chunk_size]
+            level['grid'] = grid
+            level['contains'] = contains
+            level['start_pos'] = start_pos
+            level['start_dir'] = start_dir
+            level['mission'] = value_idx(mission)
+            level['attrs'] = [value_idx(value) for value in attrs]
+            level['seed'] = seed
+
+            num_levels += 1
+            if num_levels % chunk_size == 0:
+                f.write(chunk.tobytes())
+
+        f.write(chunk[:num_levels % chunk_size].tobytes())
+
+        header = json.dumps({
+            'env_id': env_id if isinstance(env_id, str) else None,
+            'width': width,
+            'height': height,
+            'level_attrs': attr_names,
+            'values': values
+        }).encode()
+        header_offset = f.tell()
+        f.write(header)
+
+        f.seek(0)
+        f.write(_PREAMBLE.pack(
+            LEVELS_MAGIC,
+            LEVELS_VERSION,
+            num_levels,
+            header_offset,
+            len(header)
+        ))
+
+    env.close()
+
+    return num_levels
+
+class LevelLibrary:
+    """
+    Library of levels stored in a file written by write_levels, which is
+    memory-mapped, so that libraries of millions of levels can be used
+    without loading them in memory.
+
+    Environments reset from a library by setting their level_library
+    attribute. The level of each episode is then drawn at random among the
+    levels of the library with the RNG of the environment, or taken in
+    order if sequential is True. The levels can be restricted to a subset
+    of the library (eg: a train or test split) with indices:
+
+        library = LevelLibrary('levels.bin', indices=range(0, 900000))
+        env.level_library = library
+
+    Levels store the grid, start position and direction, mission and the
+    attributes named in the level_attrs of the environment class.
+    """
+
+    def __init__(self, path, indices=None, sequential=False):
+        with open(path, 'rb') as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise ValueError("'%s' is not a level library" % path)
+            magic, version, num_levels, header_offset, header_size = _PREAMBLE.unpack(preamble)
+            if magic != LEVELS_MAGIC:
+                raise ValueError("'%s' is not a level library" % path)
+            if version != LEVELS_VERSION:
+                raise ValueError('unsupported level library version %d' % version)
+            f.seek(header_offset)
+            header = json.loads(f.read(header_size).decode())
+
+        self.env_id = header['env_id']
+        self.width = header['width']
+        self.height = header['height']
+        self.attr_names = header['level_attrs']
+        self.values = header['values']
+
+        dtype = level_dtype(self.width, self.height, len(self.attr_names))
+        if num_levels == 0:
+            self.levels = np.zeros(shape=(0,), dtype=dtype)
+        else:
+            self.levels = np.memmap(
+                path,
+                dtype=dtype,
+                mode='r',
+                offset=_PREAMBLE.size,
+                shape=(num_levels,)
+            )
+
+        if indices is None:
+            indices = np.arange(num_levels)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        assert len(self.indices) > 0 or num_levels == 0
+        assert np.all((self.indices >= 0) & (self.indices < num_levels))
+
+        self.sequential = sequential
+        self.next_idx = 0
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def seeds(self):
+        """
+        Seeds which generated the levels of the library
+        """
+
+        return self.levels['seed'][self.indices]
+
+    def load(self, env, idx):
+        """
+        Load the level with index idx into an environment, in place of
+        calling _gen_grid
+        """
+
+        level = self.levels[self.indices[idx]]
+
+        assert env.grid_size == self.width, 'environment and levels sizes differ'
+
+        decode_level(
+            env,
+            level['grid'],
+            level['contains'],
+            level['start_pos'],
+            level['start_dir'],
+            self.values[level['mission']],
+            [(name, self.values[idx]) for name, idx in zip(self.attr_names, level['attrs'])]
+        )
+
+    def load_next(self, env):
+        """
+        Load the level of the next episode into an environment
+        """
+
+        if self.sequential:
+            idx = self.next_idx
+            self.next_idx = (idx + 1) % len(self)
+        else:
+            idx = env._rand_int(0, len(self))
+
+        self.load(env, idx)
@@ -1,6 +1,8 @@
 from gym_minigrid.minigrid import *
 
 class Block(WorldObj):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('block', 'red')
 
@@ -20,6 +22,8 @@ class Block(WorldObj):
         ])
 
 class BlockDoor(WorldObj):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('blockdoor', 'red')
 
@@ -39,6 +43,8 @@ class BlockDoor(WorldObj):
         ])
 
 class Other(WorldObj):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('block', 'purple')
 
@@ -58,6 +64,10 @@ class Other(WorldObj):
         ])
 
 class BlockGoal(WorldObj):
+    __slots__ = ()
+
+    flyweight = True
+
     def __init__(self):
         super().__init__('blockgoal', 'green')
 
@@ -77,6 +87,10 @@ class BlockGoal(WorldObj):
         ])
 
 class VisibleBlockGoal(WorldObj):
+    __slots__ = ()
+
+    flyweight = True
+
     def __init__(self):
         super().__init__('visibleblockgoal', 'green')
 
@@ -95,6 +109,13 @@ class VisibleBlockGoal(WorldObj):
             (0          ,           0)
         ])
 
+OBJECT_DECODERS.update({
+    'block': lambda color, is_open: Other() if color == 'purple' else Block(),
+    'blockdoor': lambda color, is_open: BlockDoor(),
+    'blockgoal': lambda color, is_open: BlockGoal.shared(),
+    'visibleblockgoal': lambda color, is_open: VisibleBlockGoal.shared()
+})
+
 class MiniBlocksEnv(MiniGridEnv):
     """
     2D block world environment.
@@ -110,6 +131,9 @@ class MiniBlocksEnv(MiniGridEnv):
     * Blocks can be pushed around by others
     """
 
+    # Area where _find_random_startpos places the agent
+    level_attrs = ('rotate', 'viable_width', 'viable_height')
+
     # Enumeration of possible actions
     class Actions(IntEnum):
         # Turn left, turn right, move forward
@@ -144,8 +168,9 @@ class MiniBlocksEnv(MiniGridEnv):
         self.observation_space = spaces.Dict({
             'image': self.observation_space
         })
-        # Range of possible rewards
-        self.reward_range = (0, 1)
+        # Range of possible rewards: a penalty of 1 / max_steps per step, up
+        # to the reward for pushing a block onto its goal
+        self.reward_range = (-1.0 / max_steps, 2.0)
         # Renderer object used to render the whole grid (full-scale)
         self.grid_render = None
         # Renderer used to render observations (small-scale agent view)
@@ -180,7 +205,7 @@ class MiniBlocksEnv(MiniGridEnv):
             vis_mask = np.ones(shape=(self.grid.width, self.grid.height), dtype=np.bool)
         return self.grid, vis_mask
 
-    def _find_random_startpos(self, num_tries = math.inf):
+    def _find_random_startpos(self, max_tries = math.inf):
 
         rot = self.rotate
         if rot == 1:
@@ -196,7 +221,7 @@ class MiniBlocksEnv(MiniGridEnv):
         while True:
             # This is to handle with rare cases where rejection sampling
             # gets stuck in an infinite loop
-            if num_tries > num_tries:
+            if num_tries > max_tries:
                 raise RecursionError('rejection sampling failed in place_obj')
             num_tries += 1
             pos = np.array((
@@ -214,7 +239,10 @@ class MiniBlocksEnv(MiniGridEnv):
         # Generate a new random grid at the start of each episode
         # To keep the same grid for each episode, call env.seed() with
         # the same seed before calling env.reset()
-        self._gen_grid(self.grid_size, self.grid_size)
+        self._next_level()
+
+        if self.grid_storage == 'array' and not isinstance(self.grid, ArrayGrid):
+            self.grid = ArrayGrid.from_grid(self.grid)
 
         if rand_agent_start:
             self._find_random_startpos()
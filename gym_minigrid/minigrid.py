@@ -1,6 +1,9 @@
 import math
+import copy
+import itertools
 import gym
 from enum import IntEnum
+from collections import namedtuple
 import numpy as np
 from gym import error, spaces, utils
 from gym.utils import seeding
@@ -59,6 +62,13 @@ OBJECT_TO_IDX = {
 
 IDX_TO_OBJECT = dict(zip(OBJECT_TO_IDX.values(), OBJECT_TO_IDX.keys()))
 
+# Table telling if an encoded cell blocks the view of the agent, indexed
+# by object type and state. Walls and closed doors are the only occluders.
+OPAQUE = np.zeros(shape=(len(OBJECT_TO_IDX), 2), dtype=np.bool)
+OPAQUE[OBJECT_TO_IDX['wall'], :] = True
+OPAQUE[OBJECT_TO_IDX['door'], 0] = True
+OPAQUE[OBJECT_TO_IDX['locked_door'], 0] = True
+
 # Map of agent direction indices to vectors
 DIR_TO_VEC = [
     # Pointing right (positive X)
@@ -71,11 +81,36 @@ DIR_TO_VEC = [
     np.array((0, -1)),
 ]
 
+# Shared instances of the stateless object classes, see WorldObj.shared
+_SHARED_OBJS = {}
+_SHARED_IDS = set()
+
+def _shared_instance(cls, color):
+    """
+    Get the shared instance of a stateless object class with a given color
+    """
+
+    obj = _SHARED_OBJS.get((cls, color))
+    if obj is None:
+        obj = cls.shared()
+        if obj.color != color:
+            obj = cls.shared(color)
+    return obj
+
 class WorldObj:
     """
     Base class for grid world objects
     """
 
+    __slots__ = ('type', 'color', 'contains', 'init_pos', 'cur_pos')
+
+    # Set for object classes which hold no state, whose instances can be
+    # shared between all the cells containing them
+    flyweight = False
+
+    # Attributes which can change over an episode, saved by get_state
+    state_attrs = ('contains', 'init_pos', 'cur_pos')
+
     def __init__(self, type, color):
         assert type in OBJECT_TO_IDX, type
         assert color in COLOR_TO_IDX, color
@@ -89,6 +124,73 @@ class WorldObj:
         # Current position of the object
         self.cur_pos = None
 
+    @classmethod
+    def shared(cls, *args):
+        """
+        Get the instance of a stateless object class created with the given
+        arguments, which is shared by all the grids. It must not be modified.
+        """
+
+        assert cls.flyweight, "%s instances can't be shared" % cls.__name__
+
+        key = (cls,) + args
+        obj = _SHARED_OBJS.get(key)
+        if obj is None:
+            # Default arguments give the same instance as explicit ones
+            obj = cls(*args)
+            obj = _SHARED_OBJS.setdefault((cls, obj.color), obj)
+            _SHARED_OBJS[key] = obj
+            _SHARED_IDS.add(id(obj))
+        return obj
+
+    def __copy__(self):
+        if id(self) in _SHARED_IDS:
+            return self
+        return self._copy_attrs(lambda v: v)
+
+    def __deepcopy__(self, memo):
+        if id(self) in _SHARED_IDS:
+            return self
+        return self._copy_attrs(lambda v: copy.deepcopy(v, memo), memo)
+
+    def __reduce_ex__(self, protocol):
+        # Shared instances are unpickled as the shared instance of the
+        # unpickling process
+        if id(self) in _SHARED_IDS:
+            return (_shared_instance, (type(self), self.color))
+        return super().__reduce_ex__(protocol)
+
+    def _copy_attrs(self, copy_value, memo=None):
+        """
+        Create a new instance with the attribute values of this one, passed
+        through copy_value, which are stored in slots and, for subclasses
+        without slots, in __dict__
+        """
+
+        obj = object.__new__(type(self))
+        if memo is not None:
+            memo[id(self)] = obj
+
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name != '__dict__' and hasattr(self, name):
+                    setattr(obj, name, copy_value(getattr(self, name)))
+
+        if hasattr(self, '__dict__'):
+            for name, value in self.__dict__.items():
+                obj.__dict__[name] = copy_value(value)
+
+        return obj
+
+    def get_state(self):
+        """Get the values of the attributes listed in state_attrs"""
+        return tuple(getattr(self, name) for name in self.state_attrs)
+
+    def set_state(self, state):
+        """Restore the values of the attributes listed in state_attrs"""
+        for name, value in zip(self.state_attrs, state):
+            setattr(self, name, value)
+
     def can_overlap(self):
         """Can the agent overlap with this?"""
         return False
@@ -116,6 +218,27 @@ class WorldObj:
         """Method to trigger/toggle an action this object performs"""
         return False
 
+    def encode(self):
+        """Encode this object as a (type, color, state) tuple"""
+        return (
+            OBJECT_TO_IDX[self.type],
+            COLOR_TO_IDX[self.color],
+            1 if getattr(self, 'is_open', False) else 0
+        )
+
+    @staticmethod
+    def decode(typeIdx, colorIdx, openIdx):
+        """Create an object from its (type, color, state) encoding"""
+
+        if typeIdx == 0:
+            return None
+
+        objType = IDX_TO_OBJECT[typeIdx]
+        decoder = OBJECT_DECODERS.get(objType)
+        assert decoder is not None, "unknown obj type in decode '%s'" % objType
+
+        return decoder(IDX_TO_COLOR[colorIdx], openIdx == 1)
+
     def render(self, r):
         """Draw this object with the given renderer"""
         raise NotImplementedError
@@ -127,6 +250,10 @@ class WorldObj:
         r.setColor(c[0], c[1], c[2])
 
 class Goal(WorldObj):
+    __slots__ = ()
+
+    flyweight = True
+
     def __init__(self):
         super().__init__('goal', 'green')
 
@@ -147,6 +274,10 @@ class Floor(WorldObj):
     Colored floor tile the agent can walk over
     """
 
+    __slots__ = ()
+
+    flyweight = True
+
     def __init__(self, color='blue'):
         super().__init__('floor', color)
 
@@ -166,6 +297,10 @@ class Floor(WorldObj):
         ])
 
 class Wall(WorldObj):
+    __slots__ = ()
+
+    flyweight = True
+
     def __init__(self, color='grey'):
         super().__init__('wall', color)
 
@@ -182,6 +317,10 @@ class Wall(WorldObj):
         ])
 
 class Door(WorldObj):
+    __slots__ = ('is_open',)
+
+    state_attrs = WorldObj.state_attrs + ('is_open',)
+
     def __init__(self, color, is_open=False):
         super().__init__('door', color)
         self.is_open = is_open
@@ -195,6 +334,7 @@ class Door(WorldObj):
 
     def toggle(self, env, pos):
         self.is_open = not self.is_open
+        env.grid.mark_dirty(*pos)
         return True
 
     def render(self, r):
@@ -226,6 +366,10 @@ class Door(WorldObj):
         r.drawCircle(CELL_PIXELS * 0.75, CELL_PIXELS * 0.5, 2)
 
 class LockedDoor(WorldObj):
+    __slots__ = ('is_open',)
+
+    state_attrs = WorldObj.state_attrs + ('is_open',)
+
     def __init__(self, color, is_open=False):
         super(LockedDoor, self).__init__('locked_door', color)
         self.is_open = is_open
@@ -234,6 +378,7 @@ class LockedDoor(WorldObj):
         # If the player has the right key to open the door
         if isinstance(env.carrying, Key) and env.carrying.color == self.color:
             self.is_open = True
+            env.grid.mark_dirty(*pos)
             # The key has been used, remove it from the agent
             env.carrying = None
             return True
@@ -280,6 +425,8 @@ class LockedDoor(WorldObj):
         )
 
 class Key(WorldObj):
+    __slots__ = ()
+
     def __init__(self, color='blue'):
         super(Key, self).__init__('key', color)
 
@@ -317,6 +464,8 @@ class Key(WorldObj):
         r.drawCircle(18, 9, 2)
 
 class Ball(WorldObj):
+    __slots__ = ()
+
     def __init__(self, color='blue'):
         super(Ball, self).__init__('ball', color)
 
@@ -328,6 +477,8 @@ class Ball(WorldObj):
         r.drawCircle(CELL_PIXELS * 0.5, CELL_PIXELS * 0.5, 10)
 
 class Box(WorldObj):
+    __slots__ = ()
+
     def __init__(self, color, contains=None):
         super(Box, self).__init__('box', color)
         self.contains = contains
@@ -362,6 +513,208 @@ class Box(WorldObj):
         env.grid.set(*pos, self.contains)
         return True
 
+class AgentToken(WorldObj):
+    """
+    Marker of the position of the agent, found in the observations of
+    environments which encode the agent in the grid (eg: MiniBlocksEnv).
+    The state value of the cell the agent is on (eg: an open door) is kept
+    in the encoding of the marker.
+    """
+
+    __slots__ = ('state',)
+
+    def __init__(self, color='red', state=0):
+        super().__init__('agent', color)
+        self.state = state
+
+    def encode(self):
+        return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], self.state)
+
+    def render(self, r):
+        self._set_color(r)
+        r.drawPolygon([
+            (4            , CELL_PIXELS-6),
+            (CELL_PIXELS-4, CELL_PIXELS/2),
+            (4            ,             6)
+        ])
+
+class OtherToken(AgentToken):
+    """
+    Marker of the position of another agent
+    """
+
+    __slots__ = ()
+
+    def __init__(self, color='purple', state=0):
+        WorldObj.__init__(self, 'other', color)
+        self.state = state
+
+# Constructors of the objects of each type, called by WorldObj.decode with
+# the color and open state of the object. Types defined in other modules
+# (eg: the blocks of miniblocks) are added there.
+OBJECT_DECODERS = {
+    'wall': lambda color, is_open: Wall.shared(color),
+    'floor': lambda color, is_open: Floor.shared(color),
+    'door': lambda color, is_open: Door(color, is_open),
+    'locked_door': lambda color, is_open: LockedDoor(color, is_open),
+    'key': lambda color, is_open: Key(color),
+    'ball': lambda color, is_open: Ball(color),
+    'box': lambda color, is_open: Box(color),
+    'goal': lambda color, is_open: Goal.shared(),
+    'agent': lambda color, is_open: AgentToken(color, int(is_open)),
+    'other': lambda color, is_open: OtherToken(color, int(is_open))
+}
+
+class _BitReverse(dict):
+    """
+    Table reversing the order of the bits of row bitmasks of a given
+    width, filled in as new bitmasks are looked up
+    """
+
+    def __init__(self, width):
+        super().__init__()
+        self.format = '0%db' % width
+
+    def __missing__(self, x):
+        r = self[x] = int(format(x, self.format)[::-1], 2)
+        return r
+
+# Lookup tables used by vis_mask for each row width, built on first use
+_ROW_TABLES = {}
+
+def _row_tables(width):
+    """
+    Get the weight of each cell in a row bitmask, the table reversing row
+    bitmasks, and the table expanding row bitmasks to arrays of booleans.
+    For wide rows, bitmasks are only reversed as they are looked up, and
+    there is no expansion table. Rows of 63 cells or more don't fit in
+    64-bit integers, and their weights are Python integers.
+    """
+
+    tables = _ROW_TABLES.get(width)
+
+    if tables is None:
+        if width < 63:
+            weights = 1 << np.arange(width)
+        else:
+            weights = np.array([1 << i for i in range(width)], dtype=object)
+        reverse = _BitReverse(width)
+        bits = None
+        if width <= 12:
+            reverse = [reverse[x] for x in range(1 << width)]
+            bits = (np.arange(1 << width)[:, None] & weights) != 0
+        tables = (weights, reverse, bits)
+        _ROW_TABLES[width] = tables
+
+    return tables
+
+def _sweep_row(mask, clear, full):
+    """
+    Propagate visibility to the right along a row of cells, as done by the
+    left-to-right pass of Grid.process_vis. Cells are bits, with the
+    leftmost cell in the lowest bit.
+
+    Returns the row mask after propagation, and the cells which propagate
+    visibility (visible and not blocking the view, excluding the last one).
+    """
+
+    # Visible cells which can propagate to their right neighbor
+    seeds = mask & clear & (full >> 1)
+
+    # Adding the seeds to the runs of clear cells carries each seed up to
+    # the first blocking cell after it, setting every cell in between
+    mask = (mask | seeds | ((clear + seeds) ^ clear)) & full
+
+    return mask, mask & clear & (full >> 1)
+
+def vis_mask(opaque, agent_pos):
+    """
+    Compute which cells are visible from the agent position, given a
+    boolean array of the cells blocking the view. This propagates
+    visibility in the same way as Grid.process_vis, but operates on
+    bitmasks of the rows of cells, for any view size.
+    """
+
+    width, height = opaque.shape
+    full = (1 << width) - 1
+    weights, reverse, bits = _row_tables(width)
+
+    # Bitmask of the cells not blocking the view, for each row
+    clear = weights.dot(~opaque).tolist()
+
+    rows = [0] * height
+    rows[agent_pos[1]] = 1 << agent_pos[0]
+
+    for j in reversed(range(1, height)):
+        # Left-to-right pass, marking the cells above and to the
+        # upper-right of the cells which propagate visibility
+        mask, spread = _sweep_row(rows[j], clear[j], full)
+        above = spread | (spread << 1)
+
+        # Right-to-left pass, done as a left-to-right pass on the
+        # mirrored row
+        mask, spread = _sweep_row(reverse[mask], reverse[clear[j]], full)
+        above |= reverse[spread | (spread << 1)]
+
+        rows[j] = reverse[mask]
+        rows[j-1] |= above
+
+    if bits is None:
+        rows = np.array(rows, dtype=weights.dtype)
+        return (rows[None, :] & weights[:, None]) != 0
+    return bits[rows].T
+
+def _zobrist_keys(index):
+    """
+    Pseudo-random 64-bit keys for an array of integer indices, computed
+    with the splitmix64 mixing function
+    """
+
+    z = np.asarray(index, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _zobrist_key(index):
+    """
+    Pseudo-random 64-bit key for an integer index, same as _zobrist_keys
+    """
+
+    z = (index + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return z ^ (z >> 31)
+
+def _cell_key(i, j, code):
+    """
+    Zobrist key of the cell at (i, j) with a (type, color, state) encoding
+    """
+
+    type, color, state = (int(v) for v in code)
+    return _zobrist_key(
+        (int(i) << 48) | (int(j) << 32) | (type << 16) | (color << 8) | state
+    )
+
+def _zobrist_hash(xs, ys, codes):
+    """
+    Zobrist hash of the cells at the given positions, with their
+    (type, color, state) encodings
+    """
+
+    xs = np.asarray(xs, dtype=np.uint64)
+    ys = np.asarray(ys, dtype=np.uint64)
+    codes = codes.astype(np.uint64)
+
+    index = (xs << np.uint64(48)) | (ys << np.uint64(32))
+    index |= codes[..., 0] << np.uint64(16)
+    index |= codes[..., 1] << np.uint64(8)
+    index |= codes[..., 2]
+
+    return int(np.bitwise_xor.reduce(_zobrist_keys(index), axis=None))
+
+# Source of the versions of the grids, see Grid.version
+_GRID_VERSIONS = itertools.count()
+
 class Grid:
     """
     Represent a grid and operations on it
@@ -375,6 +728,34 @@ class Grid:
         self.height = height
         self.grid = [None] * width * height
 
+        # Encoding of the grid, kept up to date by encode(). Invisible
+        # objects are encoded as empty cells, and their values are
+        # kept separately, by position
+        self._encoding = np.zeros(shape=(width, height, 3), dtype='uint8')
+        self._hidden = {}
+
+        # Positions of the cells changed since the encoding was updated,
+        # or a flag telling that the whole grid needs to be encoded again
+        self._dirty = set()
+        self._stale = False
+
+        # Zobrist hash of the grid (None until computed), along with the
+        # encodings it was computed from and the positions of the cells
+        # changed since then
+        self._hash = None
+        self._hashed = None
+        self._hash_dirty = set()
+
+        # Number changed whenever the contents of the grid change, which is
+        # unique among all the grids of the process
+        self.version = next(_GRID_VERSIONS)
+
+    def __setstate__(self, state):
+        # Unpickled grids get a new version, since versions are only unique
+        # within a process
+        self.__dict__.update(state)
+        self.version = next(_GRID_VERSIONS)
+
     def __contains__(self, key):
         if isinstance(key, WorldObj):
             for e in self.grid:
@@ -391,6 +772,10 @@ class Grid:
         return False
 
     def __eq__(self, other):
+        if self.width != other.width or self.height != other.height:
+            return False
+        if self.state_hash() != other.state_hash():
+            return False
         grid1 = self.encode(render_invisible = True)
         grid2 = other.encode(render_invisible = True)
         return np.array_equal(grid2, grid1)
@@ -402,27 +787,147 @@ class Grid:
         from copy import deepcopy
         return deepcopy(self)
 
+    def __deepcopy__(self, memo):
+        # Shared objects are kept as they are, and the other attributes
+        # are copied without going through deepcopy for each cell
+        grid = copy.copy(self)
+        memo[id(self)] = grid
+
+        grid.grid = [
+            v if v is None or id(v) in _SHARED_IDS else copy.deepcopy(v, memo)
+            for v in self.grid
+        ]
+        grid._encoding = self._encoding.copy()
+        grid._hidden = dict(self._hidden)
+        grid._dirty = set(self._dirty)
+        if self._hashed is not None:
+            grid._hashed = self._hashed.copy()
+        grid._hash_dirty = set(self._hash_dirty)
+
+        return grid
+
     def set(self, i, j, v):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
         self.grid[j * self.width + i] = v
+        self._dirty.add((i, j))
+        if self._hash is not None:
+            self._hash_dirty.add((i, j))
+        self.version = next(_GRID_VERSIONS)
 
     def get(self, i, j):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
         return self.grid[j * self.width + i]
 
+    def mark_dirty(self, i, j):
+        """
+        Signal that the state of the object at (i, j) was changed, so that
+        its encoding gets updated. Objects changing their own state (eg:
+        doors being opened) must call this.
+        """
+
+        self._dirty.add((i, j))
+        if self._hash is not None:
+            self._hash_dirty.add((i, j))
+        self.version = next(_GRID_VERSIONS)
+
+    def state_hash(self):
+        """
+        Get a 64-bit Zobrist hash of the contents of the grid, including
+        the state of the objects and the invisible objects. The hash is
+        updated from the cells changed since it was last computed.
+        """
+
+        if self._hash is None:
+            codes = self.encode(render_invisible=True)
+            xs, ys = np.indices((self.width, self.height))
+            self._hash = _zobrist_hash(xs, ys, codes)
+            self._hashed = codes
+            self._hash_dirty.clear()
+
+        else:
+            for i, j in self._hash_dirty:
+                v = self.get(i, j)
+                code = (0, 0, 0) if v is None else v.encode()
+                self._hash ^= _cell_key(i, j, self._hashed[i, j])
+                self._hash ^= _cell_key(i, j, code)
+                self._hashed[i, j] = code
+            self._hash_dirty.clear()
+
+        return self._hash
+
+    def get_state(self):
+        """
+        Get a snapshot of the contents of the grid. The objects themselves
+        are referenced, not copied, and their state is saved separately
+        (see MiniGridEnv.get_state).
+        """
+
+        self._update_encoding()
+        encoding = self._encoding.copy()
+        encoding.flags.writeable = False
+        return (tuple(self.grid), encoding, tuple(self._hidden.items()))
+
+    def set_state(self, state):
+        """
+        Restore the contents of the grid from a snapshot
+        """
+
+        cells, encoding, hidden = state
+        self.grid[:] = cells
+        self._encoding[:] = encoding
+        self._hidden = dict(hidden)
+        self._dirty.clear()
+        self._stale = False
+        self._hash = None
+        self.version = next(_GRID_VERSIONS)
+
+    def empty_mask(self, top=(0, 0), size=None):
+        """
+        Get a boolean mask of the cells containing no object in a
+        rectangle, computed from the cached encoding of the grid
+        """
+
+        x, y = top
+        if size is None:
+            size = (self.width - x, self.height - y)
+        w, h = size
+
+        if self._dirty or self._stale:
+            self._update_encoding()
+
+        mask = self._encoding[x:x+w, y:y+h, 0] == 0
+
+        # Invisible objects are encoded as empty cells
+        for i, j in self._hidden:
+            if i >= x and i < x + w and j >= y and j < y + h:
+                mask[i - x, j - y] = False
+
+        return mask
+
+    def get_objs(self):
+        """
+        List the objects in the grid which have a state of their own,
+        excluding the shared tiles
+        """
+
+        return [
+            v for v in self.grid
+            if v is not None and id(v) not in _SHARED_IDS
+        ]
+
     def horz_wall(self, x, y, length=None):
         if length is None:
             length = self.width - x
         for i in range(0, length):
-            self.set(x + i, y, Wall())
+            self.set(x + i, y, Wall.shared())
 
     def vert_wall(self, x, y, length=None):
         if length is None:
             length = self.height - y
         for j in range(0, length):
-            self.set(x, y + j, Wall())
+            self.set(x, y + j, Wall.shared())
 
     def wall_rect(self, x, y, w, h):
         self.horz_wall(x, y, w)
@@ -437,10 +942,13 @@ class Grid:
 
         grid = Grid(self.width, self.height)
 
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                v = self.get(self.width - 1 - j, i)
-                grid.set(i, j, v)
+        w = self.width
+        grid.grid = [
+            self.grid[i * w + w - 1 - j]
+            for j in range(0, self.height)
+            for i in range(0, self.width)
+        ]
+        grid._stale = True
 
         return grid
 
@@ -451,6 +959,7 @@ class Grid:
 
         grid = Grid(width, height)
 
+        cells = grid.grid
         for j in range(0, height):
             for i in range(0, width):
                 x = topX + i
@@ -458,11 +967,12 @@ class Grid:
 
                 if x >= 0 and x < self.width and \
                    y >= 0 and y < self.height:
-                    v = self.get(x, y)
+                    v = self.grid[y * self.width + x]
                 else:
-                    v = Wall()
+                    v = Wall.shared()
 
-                grid.set(i, j, v)
+                cells[j * width + i] = v
+        grid._stale = True
 
         return grid
 
@@ -517,35 +1027,133 @@ class Grid:
 
         r.pop()
 
-    def encode(self, render_invisible = False, agent_pos = None, agent_color = None):
+    def render_tiles(self, r, tile_size, agent_pos=None, agent_dir=None, highlight_mask=None):
         """
-        Produce a compact numpy encoding of the grid
+        Render this grid with cached tiles, redrawing only the cells which
+        changed since the previous frame drawn into r with this method
+        :param r: target renderer object, see Renderer.drawTiles
+        :param highlight_mask: cells visible to the agent, to highlight
+        """
+
+        assert r.width == self.width * tile_size
+        assert r.height == self.height * tile_size
+
+        # Tile keys, from the cell encoding, highlight and agent direction
+        codes = self.encode(render_invisible=True).astype(np.int64)
+        keys = (codes[..., 0] * len(COLOR_TO_IDX) + codes[..., 1]) * 2 + codes[..., 2]
+        keys *= 2
+        if highlight_mask is not None:
+            keys += highlight_mask
+        keys *= 5
+        if agent_pos is not None:
+            keys[agent_pos[0], agent_pos[1]] += 1 + agent_dir
+
+        def draw_tile(r, i, j):
+            r.push()
+            r.scale(tile_size / CELL_PIXELS, tile_size / CELL_PIXELS)
+
+            # Grid lines along the top and left edges of the cell
+            r.setLineColor(100, 100, 100)
+            r.drawLine(0, 0, CELL_PIXELS, 0)
+            r.drawLine(0, 0, 0, CELL_PIXELS)
+
+            cell = self.get(i, j)
+            if cell != None:
+                r.push()
+                cell.render(r)
+                r.pop()
+
+            if agent_pos is not None and (i, j) == tuple(agent_pos):
+                r.push()
+                r.translate(CELL_PIXELS * 0.5, CELL_PIXELS * 0.5)
+                r.rotate(agent_dir * 90)
+                r.setLineColor(255, 0, 0)
+                r.setColor(255, 0, 0)
+                r.drawPolygon([
+                    (-12, 10),
+                    ( 12,  0),
+                    (-12, -10)
+                ])
+                r.pop()
+
+            if highlight_mask is not None and highlight_mask[i, j]:
+                r.fillRect(0, 0, CELL_PIXELS, CELL_PIXELS, 255, 255, 255, 75)
+
+            r.pop()
+
+        r.drawTiles(keys, tile_size, draw_tile)
+
+    def _update_encoding(self):
+        """
+        Re-encode the cells changed since the last update
         """
 
-        codeSize = self.width * self.height * 3
+        hidden = self._hidden
+        xs, ys, codes = [], [], []
+
+        if self._stale:
+            self._encoding[:] = 0
+            hidden.clear()
+            cells = [
+                (k % self.width, k // self.width)
+                for k, v in enumerate(self.grid)
+                if v is not None
+            ]
+        else:
+            cells = self._dirty
 
-        array = np.zeros(shape=(self.width, self.height, 3), dtype='uint8')
+        for i, j in cells:
+            v = self.grid[j * self.width + i]
 
-        for j in range(0, self.height):
-            for i in range(0, self.width):
+            xs.append(i)
+            ys.append(j)
 
-                v = self.get(i, j)
+            if v is None:
+                codes.append((0, 0, 0))
+                hidden.pop((i, j), None)
+                continue
 
-                if v == None:
-                    continue
+            code = v.encode()
 
-                if not v.visible() and not render_invisible:
-                    continue
+            if v.visible():
+                codes.append(code)
+                hidden.pop((i, j), None)
+            else:
+                codes.append((0, 0, 0))
+                hidden[(i, j)] = code
 
-                array[i, j, 0] = OBJECT_TO_IDX[v.type]
-                array[i, j, 1] = COLOR_TO_IDX[v.color]
+        if codes:
+            self._encoding[xs, ys] = codes
+        self._dirty.clear()
+        self._stale = False
 
-                if hasattr(v, 'is_open') and v.is_open:
-                    array[i, j, 2] = 1
+    def encode(self, render_invisible = False, agent_pos = None, agent_color = None, copy = True):
+        """
+        Produce a compact numpy encoding of the grid
+        :param copy: if False, a read-only view of the cached encoding
+                     is returned when possible, which is only valid until
+                     the grid is next modified
+        """
 
-        if agent_pos is not None and agent_color is not None:
+        if self._dirty or self._stale:
+            self._update_encoding()
+
+        hidden = self._hidden if render_invisible else {}
+        draw_agent = agent_pos is not None and agent_color is not None
+
+        if not copy and not hidden and not draw_agent:
+            array = self._encoding.view()
+            array.flags.writeable = False
+            return array
+
+        array = self._encoding.copy()
+
+        for (i, j), code in hidden.items():
+            array[i, j] = code
+
+        if draw_agent:
             array[agent_pos[0], agent_pos[1], 0] = OBJECT_TO_IDX['agent']
-            array[agent_pos[0], agent_pos[1], 1] = COLOR_TO_IDX[agent_color]            
+            array[agent_pos[0], agent_pos[1], 1] = COLOR_TO_IDX[agent_color]
 
         return array
 
@@ -559,81 +1167,398 @@ class Grid:
         assert array.shape[2] == 3
 
         grid = Grid(width, height)
+        cells = grid.grid
+
+        # Only the non-empty cells are decoded, and the encodings of the
+        # decoded objects are written directly in the cached grid encoding
+        xs, ys = np.nonzero(array[:, :, 0])
+        codes = [tuple(code) for code in array[xs, ys].tolist()]
+        xs = xs.tolist()
+        ys = ys.tolist()
+
+        # Shared instance (or None), encoding and visibility of the objects
+        # decoded for each code
+        decoded = {}
+        encodings = []
+
+        for i, j, code in zip(xs, ys, codes):
+            entry = decoded.get(code)
+            if entry is None:
+                v = WorldObj.decode(*code)
+                shared = v if id(v) in _SHARED_IDS else None
+                entry = decoded[code] = (shared, v.encode(), v.visible())
+            elif entry[0] is not None:
+                v = entry[0]
+            else:
+                v = WorldObj.decode(*code)
+
+            cells[j * width + i] = v
+
+            if entry[2]:
+                encodings.append(entry[1])
+            else:
+                encodings.append((0, 0, 0))
+                grid._hidden[(i, j)] = entry[1]
+
+        if encodings:
+            grid._encoding[xs, ys] = encodings
 
-        for j in range(0, height):
-            for i in range(0, width):
+        return grid
 
-                typeIdx  = array[i, j, 0]
-                colorIdx = array[i, j, 1]
-                openIdx  = array[i, j, 2]
+    def process_vis(grid, agent_pos):
+        opaque = np.zeros(shape=(grid.width, grid.height), dtype=np.bool)
 
-                if typeIdx == 0:
-                    continue
+        for j in range(0, grid.height):
+            for i in range(0, grid.width):
+                cell = grid.grid[j * grid.width + i]
+                if cell and not cell.see_behind():
+                    opaque[i, j] = True
 
-                objType = IDX_TO_OBJECT[typeIdx]
-                color = IDX_TO_COLOR[colorIdx]
-                is_open = True if openIdx == 1 else 0
-
-                if objType == 'wall':
-                    v = Wall(color)
-                elif objType == 'floor':
-                    v = Floor(color)
-                elif objType == 'ball':
-                    v = Ball(color)
-                elif objType == 'key':
-                    v = Key(color)
-                elif objType == 'box':
-                    v = Box(color)
-                elif objType == 'door':
-                    v = Door(color, is_open)
-                elif objType == 'locked_door':
-                    v = LockedDoor(color, is_open)
-                elif objType == 'goal':
-                    v = Goal()
-                else:
-                    assert False, "unknown obj type in decode '%s'" % objType
+        mask = vis_mask(opaque, agent_pos)
 
-                grid.set(i, j, v)
+        for j in range(0, grid.height):
+            for i in range(0, grid.width):
+                if not mask[i, j]:
+                    grid.grid[j * grid.width + i] = None
+        grid._stale = True
+        grid._hash = None
+        grid.version = next(_GRID_VERSIONS)
 
-        return grid
+        return mask
 
-    def process_vis(grid, agent_pos):
-        mask = np.zeros(shape=(grid.width, grid.height), dtype=np.bool)
+class ArrayGrid(Grid):
+    """
+    Grid stored as a (width, height, 3) uint8 array of (type, color, state)
+    values, using the same layout as Grid.encode(). Stateless tiles (walls,
+    floors, goals) only exist in the array, and objects for them are built
+    when accessed with get(). Other objects (doors, keys, boxes, etc.) are
+    also kept as instances, so that their identity and state are preserved.
+
+    Single cell accesses are slightly slower than with a list grid, so this
+    only pays off for code working on the whole grid (eg: empty_mask, slice,
+    rotate_left).
+    """
 
-        mask[agent_pos[0], agent_pos[1]] = True
+    # Object classes which hold no state beyond their encoding
+    tile_classes = (Wall, Floor, Goal)
 
-        for j in reversed(range(1, grid.height)):
-            for i in range(0, grid.width-1):
-                if not mask[i, j]:
-                    continue
+    def __init__(self, width, height):
+        assert width >= 4
+        assert height >= 4
 
-                cell = grid.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
+        self.width = width
+        self.height = height
+        self.array = np.zeros(shape=(width, height, 3), dtype='uint8')
 
-                mask[i+1, j] = True
-                mask[i+1, j-1] = True
-                mask[i, j-1] = True
+        # Objects which can't be rebuilt from their encoding, by position
+        self.objs = {}
 
-            for i in reversed(range(1, grid.width)):
-                if not mask[i, j]:
-                    continue
+        # Positions of the objects which are not visible to the agent
+        self._hidden = set()
 
-                cell = grid.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
+        # Zobrist hash of the grid, see Grid.state_hash. Changed cells are
+        # only tracked once the hash has been computed.
+        self._hash = None
+        self._hashed = None
+        self._hash_dirty = set()
+
+        self.version = next(_GRID_VERSIONS)
+
+    @staticmethod
+    def from_grid(grid):
+        """
+        Convert a list-based grid to the array representation
+        """
 
-                mask[i-1, j-1] = True
-                mask[i-1, j] = True
-                mask[i, j-1] = True
+        array_grid = ArrayGrid(grid.width, grid.height)
 
         for j in range(0, grid.height):
             for i in range(0, grid.width):
-                if not mask[i, j]:
-                    grid.set(i, j, None)
+                v = grid.get(i, j)
+                if v is not None:
+                    array_grid.set(i, j, v)
+
+        return array_grid
+
+    def __deepcopy__(self, memo):
+        grid = copy.copy(self)
+        memo[id(self)] = grid
+
+        grid.array = self.array.copy()
+        grid.objs = {
+            pos: copy.deepcopy(v, memo) for pos, v in self.objs.items()
+        }
+        grid._hidden = set(self._hidden)
+        if self._hashed is not None:
+            grid._hashed = self._hashed.copy()
+        grid._hash_dirty = set(self._hash_dirty)
+
+        return grid
+
+    def get_state(self):
+        array = self.array.copy()
+        array.flags.writeable = False
+        return (array, tuple(self.objs.items()))
+
+    def set_state(self, state):
+        array, objs = state
+        self.array[:] = array
+        self.objs = dict(objs)
+        self._update_hidden()
+        self._hash = None
+        self.version = next(_GRID_VERSIONS)
+
+    def empty_mask(self, top=(0, 0), size=None):
+        x, y = top
+        if size is None:
+            size = (self.width - x, self.height - y)
+        w, h = size
+        return self.array[x:x+w, y:y+h, 0] == 0
+
+    def get_objs(self):
+        return list(self.objs.values())
+
+    def __contains__(self, key):
+        if isinstance(key, WorldObj):
+            for e in self.objs.values():
+                if e is key:
+                    return True
+        elif isinstance(key, tuple):
+            types = self.array[:, :, 0]
+            if key[1] not in OBJECT_TO_IDX:
+                return False
+            match = types == OBJECT_TO_IDX[key[1]]
+            if key[0] is not None:
+                if key[0] not in COLOR_TO_IDX:
+                    return False
+                match &= self.array[:, :, 1] == COLOR_TO_IDX[key[0]]
+            return bool(match.any())
+        return False
+
+    def _update_hidden(self):
+        self._hidden = {pos for pos, v in self.objs.items() if not v.visible()}
+
+    def set(self, i, j, v):
+        assert i >= 0 and i < self.width
+        assert j >= 0 and j < self.height
+
+        pos = (i, j)
+        if pos in self.objs:
+            del self.objs[pos]
+            self._hidden.discard(pos)
+        if self._hash is not None:
+            self._hash_dirty.add(pos)
+        self.version = next(_GRID_VERSIONS)
+
+        if v is None:
+            self.array[i, j] = 0
+            return
+
+        self.array[i, j] = v.encode()
+
+        if type(v) not in self.tile_classes:
+            self.objs[pos] = v
+            if not v.visible():
+                self._hidden.add(pos)
+
+    def get(self, i, j):
+        assert i >= 0 and i < self.width
+        assert j >= 0 and j < self.height
+
+        v = self.objs.get((i, j))
+        if v is not None:
+            return v
+
+        typeIdx = self.array.item(i, j, 0)
+
+        if typeIdx == 0:
+            return None
+
+        objType = IDX_TO_OBJECT[typeIdx]
+        color = IDX_TO_COLOR[self.array.item(i, j, 1)]
+
+        if objType == 'wall':
+            return Wall.shared(color)
+        elif objType == 'floor':
+            return Floor.shared(color)
+        elif objType == 'goal':
+            return Goal.shared()
+
+        assert False, "no object stored for '%s' at (%d, %d)" % (objType, i, j)
+
+    def mark_dirty(self, i, j):
+        """
+        Update the state value of the object at (i, j) after it was changed
+        """
+
+        v = self.objs.get((i, j))
+        if v is not None:
+            self.array[i, j, 2] = 1 if getattr(v, 'is_open', False) else 0
+            if self._hash is not None:
+                self._hash_dirty.add((i, j))
+            self.version = next(_GRID_VERSIONS)
+
+    def rotate_left(self):
+        """
+        Rotate the grid to the left (counter-clockwise)
+        """
+
+        grid = ArrayGrid(self.height, self.width)
+        grid.array = np.ascontiguousarray(np.rot90(self.array, k=-1))
+
+        for (x, y), v in self.objs.items():
+            grid.objs[(y, self.width - 1 - x)] = v
+        grid._update_hidden()
+
+        return grid
+
+    def slice(self, topX, topY, width, height):
+        """
+        Get a subset of the grid
+        """
+
+        grid = ArrayGrid(width, height)
+
+        # Cells outside of the grid are walls
+        grid.array[:, :, 0] = OBJECT_TO_IDX['wall']
+        grid.array[:, :, 1] = COLOR_TO_IDX['grey']
+
+        x0 = max(topX, 0)
+        y0 = max(topY, 0)
+        x1 = min(topX + width, self.width)
+        y1 = min(topY + height, self.height)
+
+        if x0 < x1 and y0 < y1:
+            grid.array[x0-topX:x1-topX, y0-topY:y1-topY] = self.array[x0:x1, y0:y1]
+
+            for (x, y), v in self.objs.items():
+                if x >= x0 and x < x1 and y >= y0 and y < y1:
+                    grid.objs[(x - topX, y - topY)] = v
+            grid._update_hidden()
+
+        return grid
+
+    def encode(self, render_invisible = False, agent_pos = None, agent_color = None, copy = True):
+        """
+        Produce a compact numpy encoding of the grid
+        :param copy: if False, a read-only view of the grid array
+                     is returned when possible
+        """
+
+        hidden = () if render_invisible else self._hidden
+        draw_agent = agent_pos is not None and agent_color is not None
+
+        if not copy and not hidden and not draw_agent:
+            array = self.array.view()
+            array.flags.writeable = False
+            return array
+
+        array = self.array.copy()
+
+        for i, j in hidden:
+            array[i, j] = 0
+
+        if draw_agent:
+            array[agent_pos[0], agent_pos[1], 0] = OBJECT_TO_IDX['agent']
+            array[agent_pos[0], agent_pos[1], 1] = COLOR_TO_IDX[agent_color]
+
+        return array
+
+    def process_vis(grid, agent_pos):
+        # Cells which block the view, walls being the only stateless occluders
+        opaque = grid.array[:, :, 0] == OBJECT_TO_IDX['wall']
+        for (i, j), v in grid.objs.items():
+            opaque[i, j] = not v.see_behind()
+
+        mask = vis_mask(opaque, agent_pos)
+
+        grid.array[~mask] = 0
+        for pos in list(grid.objs.keys()):
+            if not mask[pos]:
+                del grid.objs[pos]
+                grid._hidden.discard(pos)
+        grid._hash = None
+        grid.version = next(_GRID_VERSIONS)
 
         return mask
 
+class BulkRandom:
+    """
+    Random number generator drawing raw 32-bit words from a numpy
+    RandomState in blocks of block_size, and computing the numbers from
+    them as RandomState.randint and RandomState.uniform do. The numbers are
+    the same as those the RandomState methods would return, but are not
+    drawn with one numpy call each.
+
+    The RandomState is ahead of the numbers given out, and shouldn't be
+    used directly if the same sequence as before is expected.
+    """
+
+    def __init__(self, np_random, block_size=256):
+        self.np_random = np_random
+        self.block_size = block_size
+        self.words = []
+        self.pos = 0
+
+    def _next_word(self):
+        if self.pos == len(self.words):
+            self.words = self.np_random.randint(
+                0,
+                2**32,
+                size=self.block_size,
+                dtype=np.uint32
+            ).tolist()
+            self.pos = 0
+
+        word = self.words[self.pos]
+        self.pos += 1
+        return word
+
+    def randint(self, low, high):
+        """
+        Generate random integer in [low,high[
+        """
+
+        low = int(low)
+        rng = int(high) - low - 1
+        if rng < 0:
+            raise ValueError('low >= high')
+        assert rng <= 0xFFFFFFFF
+
+        # Ranges of one value don't use any random bits
+        if rng == 0:
+            return low
+
+        # Draw words masked to the number of bits of the range, until one
+        # falls in the range
+        mask = (1 << rng.bit_length()) - 1
+        while True:
+            value = self._next_word() & mask
+            if value <= rng:
+                return low + value
+
+    def uniform(self, low, high):
+        """
+        Generate random float in [low,high[
+        """
+
+        # Double with 53 random bits, taken from two words
+        a = self._next_word() >> 5
+        b = self._next_word() >> 6
+        return low + (high - low) * ((a * 67108864.0 + b) / 9007199254740992.0)
+
+    def get_state(self):
+        return (self.np_random.get_state(), tuple(self.words[self.pos:]))
+
+    def set_state(self, state):
+        np_state, words = state
+        self.np_random.set_state(np_state)
+        self.words = list(words)
+        self.pos = 0
+
+# Snapshot of the state of an environment, see MiniGridEnv.get_state
+EnvState = namedtuple('EnvState', ['attrs', 'grid', 'objs', 'rng'])
+
 class MiniGridEnv(gym.Env):
     """
     2D grid world game environment
@@ -660,6 +1585,44 @@ class MiniGridEnv(gym.Env):
         # Done completing task
         done = 6
 
+    # How the grid generated by _gen_grid is stored: 'list' keeps it as
+    # is, 'array' converts it to an ArrayGrid on every reset
+    grid_storage = 'list'
+
+    # How place_obj picks positions: 'rejection' draws positions in the
+    # rectangle until one is empty, as earlier versions did, which
+    # reproduces the levels they generated for a seed. 'index' draws one of
+    # the empty cells of the rectangle once a few random positions failed,
+    # which bounds the number of draws in nearly full rectangles.
+    place_sampling = 'rejection'
+
+    # Number of random positions 'index' sampling tries before listing the
+    # empty cells of the rectangle
+    place_index_after = 16
+
+    # Pool of pre-generated levels that reset takes levels from instead of
+    # calling _gen_grid, see gym_minigrid.levels.LevelPool
+    level_pool = None
+
+    # Library of stored levels that reset takes levels from instead of
+    # calling _gen_grid, see gym_minigrid.levels.LevelLibrary
+    level_library = None
+
+    # Attributes set by _gen_grid which the environment uses besides the
+    # grid, start position and mission (eg: the target of the mission),
+    # stored along with the levels of a LevelPool or LevelLibrary
+    level_attrs = ()
+
+    # Generate observations from the grid encoding with gen_obs_encoding.
+    # This assumes walls and closed doors are the only objects the agent
+    # can't see behind (see OPAQUE). Environments adding other occluders
+    # should set this to False.
+    fast_obs = True
+
+    # Key of the agent pose and grid version of the last observation, and
+    # the object types it contains, see agent_sees
+    _sees_cache = None
+
     def __init__(
         self,
         grid_size=16,
@@ -699,8 +1662,8 @@ class MiniGridEnv(gym.Env):
         self.max_steps = max_steps
         self.see_through_walls = see_through_walls
 
-        self.viable_width = width
-        self.viable_height = height
+        self.viable_width = grid_size
+        self.viable_height = grid_size
         self.rotate = 0
 
         # Starting position and direction for the agent
@@ -717,7 +1680,10 @@ class MiniGridEnv(gym.Env):
         # Generate a new random grid at the start of each episode
         # To keep the same grid for each episode, call env.seed() with
         # the same seed before calling env.reset()
-        self._gen_grid(self.grid_size, self.grid_size)
+        self._next_level()
+
+        if self.grid_storage == 'array' and not isinstance(self.grid, ArrayGrid):
+            self.grid = ArrayGrid.from_grid(self.grid)
 
         # These fields should be defined by _gen_grid
         assert self.start_pos is not None
@@ -744,8 +1710,94 @@ class MiniGridEnv(gym.Env):
     def seed(self, seed=1337):
         # Seed the random number generator
         self.np_random, _ = seeding.np_random(seed)
+
+        # Numbers used by the level generation are drawn in blocks
+        self.rand = BulkRandom(self.np_random)
+
         return [seed]
 
+    def _next_level(self):
+        """
+        Set up the level of a new episode, taken from the level library or
+        pool if there is one, or else generated with _gen_grid
+        """
+
+        if self.level_library is not None:
+            self.level_library.load_next(self)
+        elif self.level_pool is not None:
+            self.level_pool.load_next(self)
+        else:
+            self._gen_grid(self.grid_size, self.grid_size)
+
+    def get_state(self):
+        """
+        Get a snapshot of the state of the environment, which can be
+        restored with set_state to branch from it (eg: for tree search).
+
+        The snapshot references the grid and the objects instead of copying
+        them, and saves the attributes of the environment (agent position
+        and direction, carried object, step count, mission, etc.), the
+        contents of the grid, the attributes of the objects that can change
+        (see WorldObj.state_attrs) and the state of the RNG. The identity of
+        the objects is preserved, so that environments comparing objects
+        (eg: self.carrying == self.obj) keep working after a restore.
+        """
+
+        objs = self.grid.get_objs()
+        if self.carrying is not None:
+            objs.append(self.carrying)
+
+        # Include the objects contained in boxes
+        for obj in objs:
+            if obj.contains is not None:
+                objs.append(obj.contains)
+
+        attrs = tuple(
+            (name, value) for name, value in self.__dict__.items()
+            if name not in ('grid_render', 'obs_render', 'np_random', 'rand')
+        )
+
+        return EnvState(
+            attrs=attrs,
+            grid=self.grid.get_state(),
+            objs=tuple((obj, obj.get_state()) for obj in objs),
+            rng=self.rand.get_state()
+        )
+
+    def set_state(self, state):
+        """
+        Restore a snapshot of the state of the environment taken with
+        get_state
+        """
+
+        self.__dict__.update(state.attrs)
+        self.grid.set_state(state.grid)
+
+        for obj, obj_state in state.objs:
+            obj.set_state(obj_state)
+
+        self.rand.set_state(state.rng)
+
+    def state_hash(self):
+        """
+        Get a 64-bit hash of the state of the environment, covering the
+        contents of the grid (including door states), the agent position
+        and direction and the carried object
+        """
+
+        # The agent and carried object keys are tagged with high bits,
+        # so that they are distinct from the keys of the grid cells
+        h = self.grid.state_hash()
+        h ^= _zobrist_key(
+            (1 << 62) | (int(self.agent_pos[0]) << 48) |
+            (int(self.agent_pos[1]) << 32) | int(self.agent_dir)
+        )
+        if self.carrying is not None:
+            type, color, state = self.carrying.encode()
+            h ^= _zobrist_key((1 << 63) | (type << 16) | (color << 8) | state)
+
+        return h
+
     @property
     def steps_remaining(self):
         return self.max_steps - self.step_count
@@ -853,21 +1905,21 @@ class MiniGridEnv(gym.Env):
         Generate random integer in [low,high[
         """
 
-        return self.np_random.randint(low, high)
+        return self.rand.randint(low, high)
 
     def _rand_float(self, low, high):
         """
         Generate random float in [low,high[
         """
 
-        return self.np_random.uniform(low, high)
+        return self.rand.uniform(low, high)
 
     def _rand_bool(self):
         """
         Generate random boolean value
         """
 
-        return (self.np_random.randint(0, 2) == 0)
+        return (self.rand.randint(0, 2) == 0)
 
     def _rand_elem(self, iterable):
         """
@@ -908,8 +1960,8 @@ class MiniGridEnv(gym.Env):
         """
 
         return (
-            self.np_random.randint(xLow, xHigh),
-            self.np_random.randint(yLow, yHigh)
+            self.rand.randint(xLow, xHigh),
+            self.rand.randint(yLow, yHigh)
         )
 
     def place_obj(self,
@@ -924,7 +1976,10 @@ class MiniGridEnv(gym.Env):
 
         :param top: top-left position of the rectangle where to place
         :param size: size of the rectangle where to place
-        :param reject_fn: function to filter out potential positions
+        :param reject_fn: function to filter out potential positions,
+                          which can set reject_fn.vectorized to be called
+                          once with the arrays of (x, y) coordinates of all
+                          the candidate positions
         """
 
         if top is None:
@@ -933,6 +1988,25 @@ class MiniGridEnv(gym.Env):
         if size is None:
             size = (self.grid.width, self.grid.height)
 
+        if self.place_sampling == 'rejection':
+            pos = self._sample_pos_rejection(top, size, reject_fn, max_tries)
+        else:
+            pos = self._sample_pos_index(top, size, reject_fn, max_tries)
+
+        self.grid.set(*pos, obj)
+
+        # Shared instances are in many cells at once, and have no position
+        if obj is not None and id(obj) not in _SHARED_IDS:
+            obj.init_pos = pos
+            obj.cur_pos = pos
+
+        return pos
+
+    def _sample_pos_rejection(self, top, size, reject_fn, max_tries):
+        """
+        Draw random positions in a rectangle until one is valid
+        """
+
         num_tries = 0
 
         while True:
@@ -960,15 +2034,72 @@ class MiniGridEnv(gym.Env):
             if reject_fn and reject_fn(self, pos):
                 continue
 
-            break
+            return pos
 
-        self.grid.set(*pos, obj)
+    def _sample_pos_index(self, top, size, reject_fn, max_tries):
+        """
+        Draw a position among the empty cells of a rectangle, with the same
+        distribution as rejection sampling, but a bounded number of draws
+        """
 
-        if obj is not None:
-            obj.init_pos = pos
-            obj.cur_pos = pos
+        # Most rectangles are mostly empty, and a few random positions find
+        # an empty cell faster than listing the empty cells
+        num_tries = 0
+        max_draws = min(self.place_index_after, max_tries)
+        while num_tries < max_draws:
+            num_tries += 1
 
-        return pos
+            pos = np.array((
+                self._rand_int(top[0], top[0] + size[0]),
+                self._rand_int(top[1], top[1] + size[1])
+            ))
+
+            if self.grid.get(*pos) != None:
+                continue
+            if np.array_equal(pos, self.start_pos):
+                continue
+            if reject_fn and reject_fn(self, pos):
+                continue
+
+            return pos
+
+        # Don't place the object on top of another object
+        mask = self.grid.empty_mask(top, size)
+
+        # Don't place the object where the agent is
+        if self.start_pos is not None:
+            i = self.start_pos[0] - top[0]
+            j = self.start_pos[1] - top[1]
+            if i >= 0 and i < mask.shape[0] and j >= 0 and j < mask.shape[1]:
+                mask[i, j] = False
+
+        xs, ys = np.nonzero(mask)
+        xs += top[0]
+        ys += top[1]
+
+        # Filtering criteria accepting arrays of coordinates are applied
+        # to all the candidates at once
+        if reject_fn and getattr(reject_fn, 'vectorized', False):
+            keep = ~np.broadcast_to(reject_fn(self, (xs, ys)), xs.shape)
+            xs, ys = xs[keep], ys[keep]
+            reject_fn = None
+
+        while True:
+            if len(xs) == 0 or num_tries > max_tries:
+                raise RecursionError('no valid position found in place_obj')
+
+            num_tries += 1
+
+            k = self._rand_int(0, len(xs))
+            pos = np.array((xs[k], ys[k]))
+
+            # Rejected candidates are not drawn again
+            if reject_fn and reject_fn(self, pos):
+                xs = np.delete(xs, k)
+                ys = np.delete(ys, k)
+                continue
+
+            return pos
 
     def place_agent(
         self,
@@ -1025,8 +2156,8 @@ class MiniGridEnv(gym.Env):
         """
 
         ax, ay = self.agent_pos
-        dx, dy = self.dir_vec
-        rx, ry = self.right_vec
+        dx, dy = DIR_TO_VEC[self.agent_dir].tolist()
+        rx, ry = -dy, dx
 
         # Compute the absolute coordinates of the top-left view corner
         sz = AGENT_VIEW_SIZE
@@ -1084,12 +2215,66 @@ class MiniGridEnv(gym.Env):
         if vx < 0 or vy < 0 or vx >= AGENT_VIEW_SIZE or vy >= AGENT_VIEW_SIZE:
             return False
 
-        obs = self.gen_obs()
-        obs_grid = Grid.decode(obs['image'])
-        obs_cell = obs_grid.get(vx, vy)
+        obs_type = int(self._observed_types()[vx, vy])
         world_cell = self.grid.get(x, y)
 
-        return obs_cell is not None and obs_cell.type == world_cell.type
+        return obs_type != 0 and IDX_TO_OBJECT[obs_type] == world_cell.type
+
+    def agent_sees_many(self, positions):
+        """
+        Check if a list of grid positions, with shape (N, 2), are visible to
+        the agent. This gives the same result as calling agent_sees for each
+        position, with the positions of empty cells not seen.
+        """
+
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        xs = positions[:, 0]
+        ys = positions[:, 1]
+        assert np.all(positions >= 0)
+        world_types = self.grid.encode(render_invisible=True, copy=False)[xs, ys, 0]
+
+        vx, vy = self.get_view_coords(xs, ys)
+        inside = (vx >= 0) & (vy >= 0) & (vx < AGENT_VIEW_SIZE) & (vy < AGENT_VIEW_SIZE)
+
+        # Positions outside of the view are looked up at (0, 0) and masked
+        types = self._observed_types()
+        view_idxs = np.where(inside, vx * types.shape[1] + vy, 0)
+        obs_types = types.ravel()[view_idxs]
+
+        return inside & (obs_types != 0) & (obs_types == world_types)
+
+    def _sees_key(self):
+        """
+        Key of the state the observation of the agent depends on
+        """
+
+        carrying = self.carrying
+        return (
+            self.grid.version,
+            int(self.agent_pos[0]),
+            int(self.agent_pos[1]),
+            self.agent_dir,
+            None if carrying is None else (carrying.encode(), carrying.visible()),
+            self.see_through_walls
+        )
+
+    def _observed_types(self):
+        """
+        Get the object types in the current observation of the agent, taken
+        from the last observation generated when the agent pose and grid
+        haven't changed since
+        """
+
+        # Environments with their own observations are not cached
+        if type(self).gen_obs is not MiniGridEnv.gen_obs:
+            return self.gen_obs()['image'][:, :, 0]
+
+        cache = self._sees_cache
+        if cache is None or cache[0] != self._sees_key():
+            self.gen_obs()
+            cache = self._sees_cache
+
+        return cache[1]
 
     def step(self, action):
 
@@ -1188,15 +2373,62 @@ class MiniGridEnv(gym.Env):
 
         return grid, vis_mask
 
+    def gen_obs_encoding(self):
+        """
+        Generate the encoding of the sub-grid observed by the agent, along
+        with its visibility mask. This gives the same result as encoding the
+        grid produced by gen_obs_grid, but works directly on the encoding of
+        the whole grid, without building any intermediate grid.
+        """
+
+        topX, topY, botX, botY = self.get_view_exts()
+
+        world = self.grid.encode(copy=False)
+
+        # Cells outside of the grid are seen as walls
+        view = np.empty(shape=OBS_ARRAY_SIZE, dtype='uint8')
+        view[:, :] = (OBJECT_TO_IDX['wall'], COLOR_TO_IDX['grey'], 0)
+
+        x0 = max(topX, 0)
+        y0 = max(topY, 0)
+        x1 = min(botX, self.grid.width)
+        y1 = min(botY, self.grid.height)
+        if x0 < x1 and y0 < y1:
+            view[x0-topX:x1-topX, y0-topY:y1-topY] = world[x0:x1, y0:y1]
+
+        # Rotate the view so the agent is facing up, which is the same as
+        # rotating the grid left agent_dir + 1 times
+        view = np.rot90(view, k=-(self.agent_dir + 1)).copy()
+
+        agent_pos = (AGENT_VIEW_SIZE // 2, AGENT_VIEW_SIZE - 1)
+
+        # Process occluders and visibility
+        if not self.see_through_walls:
+            mask = vis_mask(OPAQUE[view[:, :, 0], view[:, :, 2]], agent_pos)
+            view[~mask] = 0
+        else:
+            mask = np.ones(shape=(AGENT_VIEW_SIZE, AGENT_VIEW_SIZE), dtype=np.bool)
+
+        # Make it so the agent sees what it's carrying
+        if self.carrying and self.carrying.visible():
+            view[agent_pos] = self.carrying.encode()
+        else:
+            view[agent_pos] = 0
+
+        return view, mask
+
     def gen_obs(self):
         """
         Generate the agent's view (partially observable, low-resolution encoding)
         """
 
-        grid, vis_mask = self.gen_obs_grid()
+        if self.fast_obs:
+            image, vis_mask = self.gen_obs_encoding()
+        else:
+            grid, vis_mask = self.gen_obs_grid()
 
-        # Encode the partially observable view into a numpy array
-        image = grid.encode()
+            # Encode the partially observable view into a numpy array
+            image = grid.encode()
 
         assert hasattr(self, 'mission'), "environments must define a textual mission string"
 
@@ -1210,6 +2442,8 @@ class MiniGridEnv(gym.Env):
             'mission': self.mission
         }
 
+        self._sees_cache = (self._sees_key(), image[:, :, 0].copy())
+
         return obs
 
     def get_obs_render(self, obs, tile_pixels=CELL_PIXELS//2):
@@ -1255,6 +2489,51 @@ class MiniGridEnv(gym.Env):
 
         return r.getPixmap()
 
+    def get_highlight_mask(self):
+        """
+        Compute which cells of the grid are visible to the agent, as
+        a boolean array of shape (width, height)
+        """
+
+        if self.fast_obs:
+            _, vis_mask = self.gen_obs_encoding()
+        else:
+            _, vis_mask = self.gen_obs_grid()
+
+        f_vec = self.dir_vec
+        r_vec = self.right_vec
+        top_left = self.agent_pos + f_vec * (AGENT_VIEW_SIZE-1) - r_vec * (AGENT_VIEW_SIZE // 2)
+
+        # World coordinates of the visible cells of the agent's view
+        vis_i, vis_j = np.nonzero(vis_mask)
+        abs_i = top_left[0] - f_vec[0] * vis_j + r_vec[0] * vis_i
+        abs_j = top_left[1] - f_vec[1] * vis_j + r_vec[1] * vis_i
+
+        inside = (abs_i >= 0) & (abs_i < self.grid.width)
+        inside &= (abs_j >= 0) & (abs_j < self.grid.height)
+
+        mask = np.zeros(shape=(self.grid.width, self.grid.height), dtype=np.bool)
+        mask[abs_i[inside], abs_j[inside]] = True
+
+        return mask
+
+    def render_rgb(self, tile_size=CELL_PIXELS, highlight=True, out=None):
+        """
+        Render the whole grid as an array of RGB pixel values, using
+        pre-rendered tiles instead of a Qt renderer
+        :param out: optional array the pixels are written into
+        """
+
+        from gym_minigrid.tile_rendering import TileAtlas
+
+        return TileAtlas.get(tile_size).render(
+            self.grid,
+            self.agent_pos,
+            self.agent_dir,
+            self.get_highlight_mask() if highlight else None,
+            out
+        )
+
     def render(self, mode='human', close=False):
         """
         Render the whole-grid human view
@@ -1265,6 +2544,10 @@ class MiniGridEnv(gym.Env):
                 self.grid_render.close()
             return
 
+        # Pixel arrays are produced without Qt
+        if mode == 'rgb_array':
+            return self.render_rgb()
+
         if self.grid_render is None:
             from gym_minigrid.rendering import Renderer
             self.grid_render = Renderer(
@@ -1275,60 +2558,22 @@ class MiniGridEnv(gym.Env):
 
         r = self.grid_render
 
-        r.beginFrame()
-
-        # Render the whole grid
-        self.grid.render(r, CELL_PIXELS)
-
-        # Draw the agent
-        r.push()
-        r.translate(
-            CELL_PIXELS * (self.agent_pos[0] + 0.5),
-            CELL_PIXELS * (self.agent_pos[1] + 0.5)
+        # Only the cells which changed since the last frame are redrawn
+        r.beginFrame(clear=False)
+
+        # Render the whole grid, the agent, and highlight the cells
+        # visible to the agent
+        self.grid.render_tiles(
+            r,
+            CELL_PIXELS,
+            self.agent_pos,
+            self.agent_dir,
+            self.get_highlight_mask()
         )
-        r.rotate(self.agent_dir * 90)
-        r.setLineColor(255, 0, 0)
-        r.setColor(255, 0, 0)
-        r.drawPolygon([
-            (-12, 10),
-            ( 12,  0),
-            (-12, -10)
-        ])
-        r.pop()
-
-        # Compute which cells are visible to the agent
-        _, vis_mask = self.gen_obs_grid()
-
-        # Compute the absolute coordinates of the bottom-left corner
-        # of the agent's view area
-        f_vec = self.dir_vec
-        r_vec = self.right_vec
-        top_left = self.agent_pos + f_vec * (AGENT_VIEW_SIZE-1) - r_vec * (AGENT_VIEW_SIZE // 2)
-
-        # For each cell in the visibility mask
-        for vis_j in range(0, AGENT_VIEW_SIZE):
-            for vis_i in range(0, AGENT_VIEW_SIZE):
-                # If this cell is not visible, don't highlight it
-                if not vis_mask[vis_i, vis_j]:
-                    continue
-
-                # Compute the world coordinates of this cell
-                abs_i, abs_j = top_left - (f_vec * vis_j) + (r_vec * vis_i)
-
-                # Highlight the cell
-                r.fillRect(
-                    abs_i * CELL_PIXELS,
-                    abs_j * CELL_PIXELS,
-                    CELL_PIXELS,
-                    CELL_PIXELS,
-                    255, 255, 255, 75
-                )
 
         r.endFrame()
 
-        if mode == 'rgb_array':
-            return r.getArray()
-        elif mode == 'pixmap':
+        if mode == 'pixmap':
             return r.getPixmap()
 
         return r
\ No newline at end of file
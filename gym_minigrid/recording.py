@@ -0,0 +1,230 @@
+import os
+import json
+import queue
+import threading
+
+import numpy as np
+
+import gym
+
+from gym_minigrid.wrappers import EnvAttrWrapper
+
+def load_video(path):
+    """
+    Memory-map the frames of a video recorded in the raw format, as an
+    array of shape (num_frames, height, width, 3)
+    """
+
+    with open(path + '.json') as f:
+        meta = json.load(f)
+
+    shape = tuple(meta['shape'])
+    if shape[0] == 0:
+        return np.zeros(shape=shape, dtype=meta['dtype'])
+
+    return np.memmap(path + '.frames', dtype=meta['dtype'], mode='r', shape=shape)
+
+class RawVideoWriter:
+    """
+    Writes frames one after the other to a file, with the shape of the
+    array they form saved in a JSON file when closed
+    """
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.file = open(path + '.frames', 'wb')
+        self.num_frames = 0
+        self.frame_shape = None
+
+    def append_data(self, frame):
+        self.file.write(frame.data)
+        self.num_frames += 1
+        self.frame_shape = frame.shape
+
+    def close(self):
+        self.file.close()
+
+        meta = {
+            'shape': [self.num_frames] + list(self.frame_shape or (0, 0, 3)),
+            'dtype': 'uint8'
+        }
+        with open(self.path + '.json', 'w') as f:
+            json.dump(meta, f)
+
+class ImageioVideoWriter:
+    """
+    Encodes frames into a video file with imageio
+    """
+
+    def __init__(self, path, fps):
+        import imageio
+        self.writer = imageio.get_writer(path + '.mp4', fps=fps)
+
+    def append_data(self, frame):
+        self.writer.append_data(frame)
+
+    def close(self):
+        self.writer.close()
+
+VIDEO_WRITERS = {
+    'raw': RawVideoWriter,
+    'mp4': ImageioVideoWriter
+}
+
+class VideoRecorderWrapper(EnvAttrWrapper, gym.core.Wrapper):
+    """
+    Record one in every episode_interval episodes as a video, written to
+    directory/episode_<number> as the frames are produced.
+
+    Frames are rendered with tile_size pixels per cell into queue_size
+    preallocated buffers, which are handed to a writer thread. The step
+    loop only waits for the writer when all the buffers are in use.
+
+    With format='raw', frames are written uncompressed, and can be read
+    back without loading them in memory with load_video. With
+    format='mp4', they are encoded with imageio, which must be installed
+    along with its ffmpeg plugin.
+    """
+
+    def __init__(
+        self,
+        env,
+        directory,
+        episode_interval=1,
+        tile_size=8,
+        highlight=True,
+        format='raw',
+        fps=10,
+        queue_size=16
+    ):
+        super().__init__(env)
+
+        assert format in VIDEO_WRITERS, "unknown video format '%s'" % format
+        assert episode_interval >= 1
+
+        self.directory = directory
+        self.episode_interval = episode_interval
+        self.tile_size = tile_size
+        self.highlight = highlight
+        self.writer_cls = VIDEO_WRITERS[format]
+        self.fps = fps
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Index of the current episode, and whether it is being recorded
+        self.episode_idx = -1
+        self.recording = False
+
+        size = env.unwrapped.grid_size * tile_size
+        self.frames = np.zeros(shape=(queue_size, size, size, 3), dtype='uint8')
+
+        # Indices of the frame buffers not in use by the writer thread
+        self.free = queue.Queue()
+        for idx in range(queue_size):
+            self.free.put(idx)
+
+        # Commands for the writer thread
+        self.commands = queue.Queue()
+        self.error = None
+
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        """
+        Writer thread, executing the commands sent by the wrapper
+        """
+
+        writer = None
+
+        while True:
+            cmd, arg = self.commands.get()
+
+            try:
+                if cmd == 'frame':
+                    if writer is not None:
+                        writer.append_data(self.frames[arg])
+                elif cmd == 'open':
+                    writer = self.writer_cls(arg, self.fps)
+                elif cmd == 'close':
+                    if writer is not None:
+                        writer.close()
+                    writer = None
+            except Exception as e:
+                self.error = e
+                writer = None
+            finally:
+                if cmd == 'frame':
+                    self.free.put(arg)
+                self.commands.task_done()
+
+            if cmd == 'stop':
+                break
+
+    def _send(self, cmd, arg=None):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        self.commands.put((cmd, arg))
+
+    def _record_frame(self):
+        idx = self.free.get()
+        try:
+            self.unwrapped.render_rgb(self.tile_size, self.highlight, self.frames[idx])
+            self._send('frame', idx)
+        except:
+            # The frame was not handed to the writer thread
+            self.free.put(idx)
+            raise
+
+    def _end_recording(self):
+        if self.recording:
+            self.recording = False
+            self._send('close')
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+
+        self._end_recording()
+
+        self.episode_idx += 1
+        if self.episode_idx % self.episode_interval == 0:
+            path = os.path.join(self.directory, 'episode_%06d' % self.episode_idx)
+            self._send('open', path)
+            self.recording = True
+            self._record_frame()
+
+        return obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+
+        if self.recording:
+            self._record_frame()
+
+        return obs, reward, done, info
+
+    def flush(self):
+        """
+        Wait until the frames recorded so far are written, and the videos
+        of the previous episodes closed
+        """
+
+        self.commands.join()
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        try:
+            if self.thread.is_alive():
+                try:
+                    self._end_recording()
+                finally:
+                    # Stop the writer thread even if it reported an error
+                    self.commands.put(('stop', None))
+                    self.thread.join()
+                self.flush()
+        finally:
+            self.env.close()
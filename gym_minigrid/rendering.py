@@ -81,14 +81,45 @@ class Window(QMainWindow):
             return
         self.keyDownCb(keyName)
 
+# Pre-drawn tile images, shared by all renderers, by tile size and key
+TILE_CACHE = {}
+
+class ImageMemory:
+    """
+    Read-only view of the pixel memory of a QImage, as rows of bytes,
+    usable as the buffer of numpy arrays. Arrays made from it reference it,
+    which keeps the image alive as long as they are.
+    """
+
+    def __init__(self, img):
+        self.img = img
+        self.__array_interface__ = {
+            'version': 3,
+            'shape': (img.height(), img.bytesPerLine()),
+            'typestr': '|u1',
+            'data': (int(img.constBits()), True)
+        }
+
 class Renderer:
-    def __init__(self, width, height, ownWindow=False):
+    def __init__(self, width, height, ownWindow=False, numBuffers=2):
         self.width = width
         self.height = height
 
-        self.img = QImage(width, height, QImage.Format_RGB888)
+        # Frames are drawn into the images in turn, so that the array
+        # returned by getArray for a frame stays valid while the next
+        # frame is drawn
+        self.imgs = [
+            QImage(width, height, QImage.Format_RGB888)
+            for i in range(numBuffers)
+        ]
+        self.imgIdx = 0
+        self.img = self.imgs[0]
         self.painter = QPainter()
 
+        # Keys of the tiles drawn into each image by the last drawTiles
+        # call, None if the image was cleared since
+        self.tileKeys = [None] * numBuffers
+
         self.window = None
         if ownWindow:
             self.app = QApplication([])
@@ -100,13 +131,23 @@ class Renderer:
         """
         pass
 
-    def beginFrame(self):
+    def beginFrame(self, clear=True):
+        """
+        Start drawing a frame. If clear is False, the previous frame is
+        kept, for drawTiles to only redraw the tiles which changed.
+        """
+
+        self.imgIdx = (self.imgIdx + 1) % len(self.imgs)
+        self.img = self.imgs[self.imgIdx]
+
         self.painter.begin(self.img)
         self.painter.setRenderHint(QPainter.Antialiasing, False)
 
         # Clear the background
-        self.painter.setBrush(QColor(0, 0, 0))
-        self.painter.drawRect(0, 0, self.width - 1, self.height - 1)
+        if clear:
+            self.painter.setBrush(QColor(0, 0, 0))
+            self.painter.drawRect(0, 0, self.width - 1, self.height - 1)
+            self.tileKeys[self.imgIdx] = None
 
     def endFrame(self):
         self.painter.end()
@@ -121,20 +162,23 @@ class Renderer:
     def getPixmap(self):
         return QPixmap.fromImage(self.img)
 
-    def getArray(self):
+    def getArray(self, out=None):
         """
-        Get a numpy array of RGB pixel values.
-        The size argument should be (3,w,h)
+        Get a numpy array of RGB pixel values, with shape (height, width, 3).
+        The array is a read-only view of the image memory, which keeps the
+        image alive (even once the renderer is gone), and holds the pixels
+        of this frame until the image is drawn into again, numBuffers frames
+        later. Copy it to keep the frame longer. If out is given, the pixels
+        are copied into it instead.
         """
 
-        width = self.width
-        height = self.height
-        shape = (width, height, 3)
+        # Lines of pixels are padded to a multiple of 4 bytes
+        lines = np.asarray(ImageMemory(self.img))
+        output = lines[:, :self.width * 3].reshape(self.height, self.width, 3)
 
-        numBytes = self.width * self.height * 3
-        buf = self.img.bits().asstring(numBytes)
-        output = np.frombuffer(buf, dtype='uint8')
-        output = output.reshape(shape)
+        if out is not None:
+            np.copyto(out, output)
+            return out
 
         return output
 
@@ -154,10 +198,10 @@ class Renderer:
         self.painter.scale(x, y)
 
     def setLineColor(self, r, g, b, a=255):
-        self.painter.setPen(QColor(r, g, b, a))
+        self.painter.setPen(QColor(int(r), int(g), int(b), int(a)))
 
     def setColor(self, r, g, b, a=255):
-        self.painter.setBrush(QColor(r, g, b, a))
+        self.painter.setBrush(QColor(int(r), int(g), int(b), int(a)))
 
     def setLineWidth(self, width):
         pen = self.painter.pen()
@@ -165,16 +209,53 @@ class Renderer:
         self.painter.setPen(pen)
 
     def drawLine(self, x0, y0, x1, y1):
-        self.painter.drawLine(x0, y0, x1, y1)
+        self.painter.drawLine(int(x0), int(y0), int(x1), int(y1))
 
     def drawCircle(self, x, y, r):
-        center = QPoint(x, y)
-        self.painter.drawEllipse(center, r, r)
+        center = QPoint(int(x), int(y))
+        self.painter.drawEllipse(center, int(r), int(r))
 
     def drawPolygon(self, points):
         """Takes a list of points (tuples) as input"""
-        points = map(lambda p: QPoint(p[0], p[1]), points)
+        points = map(lambda p: QPoint(int(p[0]), int(p[1])), points)
         self.painter.drawPolygon(QPolygon(points))
 
+    def drawTiles(self, keys, tileSize, drawTile):
+        """
+        Draw a grid of tiles, given as an array of integer keys with shape
+        (width, height), a key identifying the contents of a tile. Only the
+        tiles whose key changed since the image was last drawn into by this
+        method are drawn.
+
+        Tiles are drawn with drawTile(r, i, j), where r is a renderer of the
+        size of a tile and (i, j) a cell with that key, the first time a key
+        is seen. They are then cached, and copied into the frame.
+        """
+
+        prevKeys = self.tileKeys[self.imgIdx]
+        if prevKeys is None or prevKeys.shape != keys.shape:
+            changed = np.ones(shape=keys.shape, dtype=bool)
+        else:
+            changed = keys != prevKeys
+
+        for i, j in zip(*np.nonzero(changed)):
+            key = (tileSize, int(keys[i, j]))
+            tile = TILE_CACHE.get(key)
+
+            if tile is None:
+                r = Renderer(tileSize, tileSize, numBuffers=1)
+                r.beginFrame()
+                drawTile(r, i, j)
+                r.endFrame()
+                tile = r.img
+                TILE_CACHE[key] = tile
+
+            self.painter.drawImage(int(i) * tileSize, int(j) * tileSize, tile)
+
+        self.tileKeys[self.imgIdx] = keys.copy()
+
     def fillRect(self, x, y, width, height, r, g, b, a=255):
-        self.painter.fillRect(QRect(x, y, width, height), QColor(r, g, b, a))
+        self.painter.fillRect(
+            QRect(int(x), int(y), int(width), int(height)),
+            QColor(int(r), int(g), int(b), int(a))
+        )
@@ -11,6 +11,9 @@ def reject_next_to(env, pos):
     d = abs(sx - x) + abs(sy - y)
     return d < 2
 
+# Positions can also be given as arrays of coordinates, see place_obj
+reject_next_to.vectorized = True
+
 class Room:
     def __init__(
         self,
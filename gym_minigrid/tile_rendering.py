@@ -0,0 +1,391 @@
+import math
+import numpy as np
+
+from gym_minigrid.minigrid import *
+
+class ArrayRenderer:
+    """
+    Renderer drawing into a numpy array of RGB pixel values, implementing
+    the drawing methods of gym_minigrid.rendering.Renderer without Qt.
+    Shapes are rasterized without anti-aliasing, by sampling pixels.
+
+    A boolean mask of the pixels drawn to is also kept, so that shapes
+    can be drawn on a transparent background (eg: the agent).
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.img = np.zeros(shape=(height, width, 3), dtype='uint8')
+        self.mask = np.zeros(shape=(height, width), dtype=np.bool)
+
+        # Pixel center and corner coordinates
+        ys, xs = np.mgrid[0:height, 0:width]
+        self.centers = (xs + 0.5, ys + 0.5)
+        self.corners = (xs.astype(np.float64), ys.astype(np.float64))
+
+        self.transform = np.identity(3)
+        self.stack = []
+
+        self.line_color = (0, 0, 0, 255)
+        self.color = (0, 0, 0, 255)
+        self.line_width = 1
+
+    def close(self):
+        pass
+
+    def beginFrame(self):
+        self.img[:] = 0
+        self.mask[:] = False
+        self.transform = np.identity(3)
+        self.stack = []
+
+    def endFrame(self):
+        pass
+
+    def getArray(self):
+        return self.img
+
+    def push(self):
+        self.stack.append((self.transform, self.line_color, self.color, self.line_width))
+
+    def pop(self):
+        self.transform, self.line_color, self.color, self.line_width = self.stack.pop()
+
+    def rotate(self, degrees):
+        a = math.radians(degrees)
+        c, s = math.cos(a), math.sin(a)
+        self.transform = self.transform.dot(np.array([
+            [c, -s, 0],
+            [s,  c, 0],
+            [0,  0, 1]
+        ]))
+
+    def translate(self, x, y):
+        self.transform = self.transform.dot(np.array([
+            [1, 0, x],
+            [0, 1, y],
+            [0, 0, 1]
+        ]))
+
+    def scale(self, x, y):
+        self.transform = self.transform.dot(np.array([
+            [x, 0, 0],
+            [0, y, 0],
+            [0, 0, 1]
+        ]))
+
+    def setLineColor(self, r, g, b, a=255):
+        self.line_color = (r, g, b, a)
+
+    def setColor(self, r, g, b, a=255):
+        self.color = (r, g, b, a)
+
+    def setLineWidth(self, width):
+        self.line_width = width
+
+    def _map(self, points):
+        """
+        Map points from the current coordinate system to pixel coordinates
+        """
+
+        points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        return points.dot(self.transform[:2, :2].T) + self.transform[:2, 2]
+
+    def _scale_factor(self):
+        return math.sqrt(abs(np.linalg.det(self.transform[:2, :2])))
+
+    def _paint(self, covered, color):
+        r, g, b, a = color
+        if a == 0:
+            return
+        if a == 255:
+            self.img[covered] = (r, g, b)
+        else:
+            # Blend the color over the current pixel values
+            alpha = a / 255
+            pixels = self.img[covered].astype(np.float64)
+            pixels = pixels * (1 - alpha) + np.array((r, g, b)) * alpha
+            self.img[covered] = np.round(pixels).astype('uint8')
+        self.mask |= covered
+
+    def _segments(self, points, closed):
+        """
+        Pixels at the given distance of the segments joining points, for
+        drawing lines with the current pen width. Pixel corners are sampled,
+        so that lines on integer coordinates cover the pixels after them.
+        """
+
+        xs, ys = self.corners
+        half_width = max(self.line_width * self._scale_factor(), 1) / 2
+        covered = np.zeros(shape=xs.shape, dtype=np.bool)
+
+        num_segments = len(points) if closed else len(points) - 1
+        for k in range(0, num_segments):
+            (x0, y0), (x1, y1) = points[k], points[(k + 1) % len(points)]
+            dx, dy = x1 - x0, y1 - y0
+            length2 = dx * dx + dy * dy
+            if length2 == 0:
+                t = 0
+            else:
+                t = np.clip(((xs - x0) * dx + (ys - y0) * dy) / length2, 0, 1)
+            dist2 = (xs - x0 - t * dx) ** 2 + (ys - y0 - t * dy) ** 2
+            covered |= dist2 <= half_width * half_width
+
+        return covered
+
+    def drawLine(self, x0, y0, x1, y1):
+        points = self._map([(x0, y0), (x1, y1)])
+        self._paint(self._segments(points, closed=False), self.line_color)
+
+    def drawCircle(self, x, y, r):
+        (cx, cy), = self._map([(x, y)])
+        r = r * self._scale_factor()
+        xs, ys = self.centers
+        dist = np.sqrt((xs - cx) ** 2 + (ys - cy) ** 2)
+        self._paint(dist <= r, self.color)
+        self._paint(np.abs(dist - r) <= 0.5, self.line_color)
+
+    def drawPolygon(self, points):
+        """Takes a list of points (tuples) as input"""
+
+        points = self._map(list(points))
+        xs, ys = self.centers
+
+        # Even-odd rule, counting the edges crossed by a ray going right
+        inside = np.zeros(shape=xs.shape, dtype=np.bool)
+        for k in range(0, len(points)):
+            (x0, y0), (x1, y1) = points[k], points[(k + 1) % len(points)]
+            if y0 == y1:
+                continue
+            crosses = (ys >= min(y0, y1)) & (ys < max(y0, y1))
+            x_cross = x0 + (ys - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (xs < x_cross)
+
+        self._paint(inside, self.color)
+        self._paint(self._segments(points, closed=True), self.line_color)
+
+    def fillRect(self, x, y, width, height, r, g, b, a=255):
+        (x0, y0), (x1, y1) = self._map([(x, y), (x + width, y + height)])
+        xs, ys = self.centers
+        covered = (xs >= min(x0, x1)) & (xs < max(x0, x1))
+        covered &= (ys >= min(y0, y1)) & (ys < max(y0, y1))
+        self._paint(covered, (r, g, b, a))
+
+# Color and opacity of the highlight of the cells visible to the agent
+HIGHLIGHT_COLOR = (255, 255, 255)
+HIGHLIGHT_ALPHA = 75
+
+def highlight(pixels):
+    """
+    Blend the highlight color over an array of pixel values
+    """
+
+    blended = pixels.astype(np.uint16) * (255 - HIGHLIGHT_ALPHA)
+    blended += np.array(HIGHLIGHT_COLOR, dtype=np.uint16) * HIGHLIGHT_ALPHA
+    return ((blended + 127) // 255).astype('uint8')
+
+def _draw_agent(r, tile_size, agent_dir):
+    """
+    Draw the agent triangle in a tile, as done by MiniGridEnv.render
+    """
+
+    r.push()
+    r.scale(tile_size / CELL_PIXELS, tile_size / CELL_PIXELS)
+    r.translate(CELL_PIXELS * 0.5, CELL_PIXELS * 0.5)
+    r.rotate(agent_dir * 90)
+    r.setLineColor(255, 0, 0)
+    r.setColor(255, 0, 0)
+    r.drawPolygon([
+        (-12, 10),
+        ( 12,  0),
+        (-12, -10)
+    ])
+    r.pop()
+
+class TileAtlas:
+    """
+    Cache of pre-rendered tiles of a given size, indexed by the
+    (type, color, state) encoding of their contents, both with and without
+    the visibility highlight. Tiles are rendered the first time they are
+    needed, with the render method of the object found in the cell.
+
+    Frames are composed by looking up the tile of each cell of an encoded
+    grid, which only takes array operations once the tiles are cached.
+    """
+
+    # Atlases by tile size, shared by all environments
+    atlases = {}
+
+    @staticmethod
+    def get(tile_size):
+        atlas = TileAtlas.atlases.get(tile_size)
+        if atlas is None:
+            atlas = TileAtlas(tile_size)
+            TileAtlas.atlases[tile_size] = atlas
+        return atlas
+
+    def __init__(self, tile_size):
+        self.tile_size = tile_size
+
+        # Tiles, with and without highlight, in order of creation
+        self.tiles = np.zeros(shape=(16, 2, tile_size, tile_size, 3), dtype='uint8')
+        self.num_tiles = 0
+
+        # Index of the tile of each encoding, -1 if not rendered yet
+        self.lookup = np.full(
+            shape=(len(OBJECT_TO_IDX), len(COLOR_TO_IDX), 2),
+            fill_value=-1,
+            dtype=np.int64
+        )
+
+        self.renderer = ArrayRenderer(tile_size, tile_size)
+
+        # Agent sprites (pixel values and mask), by direction
+        self.agent_imgs = np.zeros(shape=(4, tile_size, tile_size, 3), dtype='uint8')
+        self.agent_masks = np.zeros(shape=(4, tile_size, tile_size), dtype=np.bool)
+        for agent_dir in range(0, 4):
+            self.renderer.beginFrame()
+            _draw_agent(self.renderer, tile_size, agent_dir)
+            self.agent_imgs[agent_dir] = self.renderer.img
+            self.agent_masks[agent_dir] = self.renderer.mask
+
+        # The empty tile is always present
+        self._add_tile((0, 0, 0), None)
+
+    def _add_tile(self, code, obj):
+        """
+        Render the tile of a cell containing obj (None for an empty cell)
+        """
+
+        if self.num_tiles == len(self.tiles):
+            self.tiles = np.concatenate([self.tiles, np.zeros_like(self.tiles)])
+
+        ts = self.tile_size
+        r = self.renderer
+        r.beginFrame()
+
+        # Draw the grid lines along the top and left edges of the tile,
+        # then the object, as done by Grid.render
+        r.push()
+        r.scale(ts / CELL_PIXELS, ts / CELL_PIXELS)
+        r.setLineColor(100, 100, 100)
+        r.drawLine(0, 0, CELL_PIXELS, 0)
+        r.drawLine(0, 0, 0, CELL_PIXELS)
+        if obj is not None:
+            obj.render(r)
+        r.pop()
+
+        idx = self.num_tiles
+        self.tiles[idx, 0] = r.img
+        self.tiles[idx, 1] = highlight(r.img)
+        self.lookup[tuple(code)] = idx
+        self.num_tiles += 1
+
+    def _slots(self, codes):
+        return self.lookup[codes[..., 0], codes[..., 1], codes[..., 2]]
+
+    def _add_tiles(self, codes, grid=None):
+        """
+        Render the tiles of the encodings not seen before, drawing the
+        objects found at the same positions in grid if given, or objects
+        decoded from the encodings otherwise
+        """
+
+        for idx in zip(*np.nonzero(self._slots(codes) < 0)):
+            code = codes[idx]
+            if self.lookup[tuple(code)] >= 0:
+                continue
+            if grid is not None:
+                obj = grid.get(*idx)
+            else:
+                obj = WorldObj.decode(*code)
+            self._add_tile(code, obj)
+
+    def render(self, grid, agent_pos=None, agent_dir=None, highlight_mask=None, out=None):
+        """
+        Render a grid into an array of RGB pixel values, with shape
+        (height * tile_size, width * tile_size, 3). The agent is drawn if
+        agent_pos is given, and the cells set in highlight_mask (with shape
+        (width, height)) are highlighted.
+        """
+
+        codes = grid.encode(render_invisible=True)
+        self._add_tiles(codes, grid)
+
+        return self.render_batch(
+            codes[None],
+            agent_pos,
+            agent_dir,
+            None if highlight_mask is None else highlight_mask[None],
+            None if out is None else out[None]
+        )[0]
+
+    def render_batch(self, codes, agent_pos=None, agent_dir=None, highlight_masks=None, out=None):
+        """
+        Render a batch of encoded grids, with shape (N, width, height, 3),
+        into an array of shape (N, height * tile_size, width * tile_size, 3).
+        The agent positions and directions can be given per grid or shared
+        by all the grids (eg: (3, 6) and 3 for agent views).
+        """
+
+        codes = np.asarray(codes)
+        num, width, height = codes.shape[:3]
+        ts = self.tile_size
+
+        slots = self._slots(codes)
+        if (slots < 0).any():
+            self._add_tiles(codes)
+            slots = self._slots(codes)
+
+        if highlight_masks is None:
+            cells = self.tiles[slots, 0]
+        else:
+            highlight_masks = np.broadcast_to(highlight_masks, (num, width, height))
+            cells = self.tiles[slots, highlight_masks.astype(np.int64)]
+
+        if agent_pos is not None:
+            agent_pos = np.broadcast_to(agent_pos, (num, 2))
+            agent_dir = np.broadcast_to(agent_dir, (num,))
+            n = np.arange(num)
+            xs, ys = agent_pos[:, 0], agent_pos[:, 1]
+
+            # Draw the agents over the tiles of their cells, without highlight
+            masks = self.agent_masks[agent_dir][..., None]
+            tiles = np.where(masks, self.agent_imgs[agent_dir], self.tiles[slots[n, xs, ys], 0])
+            if highlight_masks is not None:
+                lit = highlight_masks[n, xs, ys]
+                tiles[lit] = highlight(tiles[lit])
+            cells[n, xs, ys] = tiles
+
+        if out is None:
+            out = np.empty(shape=(num, height * ts, width * ts, 3), dtype='uint8')
+        assert out.shape == (num, height * ts, width * ts, 3)
+        assert out.flags.c_contiguous
+
+        # Lay the tiles out, (x, y, row, column) to (y, row, x, column)
+        out.reshape(num, height, ts, width, ts, 3)[:] = cells.transpose(0, 2, 3, 1, 4, 5)
+
+        return out
+
+def render_batch(
+    encoded_grids,
+    agent_pos=None,
+    agent_dir=None,
+    tile_size=CELL_PIXELS,
+    highlight_masks=None,
+    out=None
+):
+    """
+    Render a batch of encoded grids, full grids or agent views, into one
+    array of RGB pixel values, see TileAtlas.render_batch
+    """
+
+    return TileAtlas.get(tile_size).render_batch(
+        encoded_grids,
+        agent_pos,
+        agent_dir,
+        highlight_masks,
+        out
+    )
@@ -0,0 +1,740 @@
+import multiprocessing as mp
+import numpy as np
+
+import gym
+
+from gym_minigrid.minigrid import *
+from gym_minigrid.minigrid import _row_tables, _sweep_row
+from gym_minigrid.miniblocks import MiniBlocksEnv
+
+# Map of agent direction indices to vectors, as an array
+DIR_VEC = np.array(DIR_TO_VEC)
+
+# Padding added around the grids, so that the agent's view never
+# goes outside of the stored arrays
+VIEW_PAD = AGENT_VIEW_SIZE - 1
+
+def _view_offsets():
+    """
+    Offsets of the cells in the agent's view relative to the agent
+    position, for each direction, with shape (4, view_size, view_size, 2)
+    """
+
+    offsets = np.zeros(shape=(4, AGENT_VIEW_SIZE, AGENT_VIEW_SIZE, 2), dtype=int)
+
+    for d in range(0, 4):
+        f_vec = DIR_TO_VEC[d]
+        r_vec = np.array((-f_vec[1], f_vec[0]))
+        for j in range(0, AGENT_VIEW_SIZE):
+            for i in range(0, AGENT_VIEW_SIZE):
+                offsets[d, i, j] = \
+                    f_vec * (AGENT_VIEW_SIZE - 1 - j) + \
+                    r_vec * (i - AGENT_VIEW_SIZE // 2)
+
+    return offsets
+
+VIEW_OFFSETS = _view_offsets()
+
+def _obj_table(types, states=(0, 1)):
+    """
+    Build a boolean table indexed by object type and state
+    """
+
+    table = np.zeros(shape=(len(OBJECT_TO_IDX), 2), dtype=np.bool)
+    for type in types:
+        for state in states:
+            table[OBJECT_TO_IDX[type], state] = True
+    return table
+
+# Objects the agent can walk over, by type and state (see can_overlap)
+CAN_OVERLAP = _obj_table(['empty', 'goal', 'floor'])
+CAN_OVERLAP |= _obj_table(['door', 'locked_door'], states=[1])
+
+# Objects the agent can pick up, by type and state (see can_pickup)
+CAN_PICKUP = _obj_table(['key', 'ball', 'box'])
+
+# Objects the agent can walk over in block worlds, by type and state
+BLOCKS_CAN_OVERLAP = CAN_OVERLAP | _obj_table(['blockgoal', 'visibleblockgoal'])
+
+# Object types which are not rendered in observations (see visible)
+INVISIBLE = np.zeros(shape=(len(OBJECT_TO_IDX),), dtype=np.bool)
+INVISIBLE[OBJECT_TO_IDX['blockgoal']] = True
+
+def _make_env(env_id):
+    """
+    Create an environment from a registered id or a constructor
+    """
+
+    if callable(env_id):
+        return env_id()
+    return gym.make(env_id).unwrapped
+
+def vis_mask_batch(opaque, agent_pos):
+    """
+    Compute the visibility masks of a batch of views, given a boolean
+    array of shape (num_views, width, height) of the cells blocking the
+    view. The agent is at the same position in every view.
+    """
+
+    num_views, width, height = opaque.shape
+    full = (1 << width) - 1
+    weights, reverse, bits = _row_tables(width)
+    assert bits is not None, "view too wide for batched visibility"
+    reverse = np.asarray(reverse)
+
+    # Bitmask of the cells not blocking the view, for each view and row
+    clear = np.tensordot(~opaque, weights, axes=([1], [0]))
+
+    rows = np.zeros(shape=(num_views, height), dtype=np.int64)
+    rows[:, agent_pos[1]] = 1 << agent_pos[0]
+
+    for j in reversed(range(1, height)):
+        mask, spread = _sweep_row(rows[:, j], clear[:, j], full)
+        above = spread | (spread << 1)
+
+        mask, spread = _sweep_row(reverse[mask], reverse[clear[:, j]], full)
+        above |= reverse[spread | (spread << 1)]
+
+        rows[:, j] = reverse[mask]
+        rows[:, j-1] |= above
+
+    return bits[rows].transpose(0, 2, 1)
+
+class VecMiniGridEnv:
+    """
+    Steps a batch of environments of the same family at once.
+
+    The state of every environment (grid encoding, agent position and
+    direction, carried object and step count) is stored in stacked arrays,
+    and actions are applied to all environments with array operations.
+    Environments are reset automatically when an episode ends, and the
+    level generation is done by the _gen_grid method of the environment
+    instances, which are otherwise only used for their configuration.
+
+    This implements the dynamics of MiniGridEnv.step and the default
+    reward. Environments overriding step or _reward with their own logic
+    (eg: RedBlueDoors, Fetch, PutNear) won't behave the same. Objects are
+    handled through their encoding, so only the built-in object types
+    are supported.
+    """
+
+    def __init__(self, env_id, num_envs, seed=1337):
+        self.envs = [_make_env(env_id) for i in range(num_envs)]
+        self.num_envs = num_envs
+
+        env = self.envs[0]
+        for e in self.envs:
+            assert isinstance(e, MiniGridEnv)
+            assert not isinstance(e, MiniBlocksEnv), "use VecMiniBlocksEnv"
+            assert e.grid_size == env.grid_size, "environments must have the same grid size"
+
+        self.actions = env.actions
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+        self.reward_range = env.reward_range
+        self.see_through_walls = env.see_through_walls
+
+        self.grid_size = env.grid_size
+        size = self.grid_size + 2 * VIEW_PAD
+
+        # Grid encodings, padded with walls on every side, and encodings of
+        # the objects contained in boxes, at the position of the boxes
+        self.grids = np.zeros(shape=(num_envs, size, size, 3), dtype='uint8')
+        self.contents = np.zeros(shape=(num_envs, size, size, 3), dtype='uint8')
+
+        # Agent position in the unpadded grid, and direction
+        self.agent_pos = np.zeros(shape=(num_envs, 2), dtype=int)
+        self.agent_dir = np.zeros(shape=(num_envs,), dtype=int)
+
+        # Encoding of the carried object (all zeros if nothing is carried)
+        # and of the object it contains
+        self.carrying = np.zeros(shape=(num_envs, 3), dtype='uint8')
+        self.carrying_contents = np.zeros(shape=(num_envs, 3), dtype='uint8')
+
+        self.step_count = np.zeros(shape=(num_envs,), dtype=int)
+        self.max_steps = np.zeros(shape=(num_envs,), dtype=int)
+        self.missions = [None] * num_envs
+
+        self.seed(seed)
+
+    def seed(self, seed=1337):
+        """
+        Seed the environments with consecutive seeds
+        """
+
+        for idx, env in enumerate(self.envs):
+            env.seed(seed + idx)
+        return [seed + idx for idx in range(self.num_envs)]
+
+    def _reset_env(self, idx):
+        """
+        Generate a new level for one environment and load its state
+        """
+
+        env = self.envs[idx]
+        env.reset()
+
+        grid = env.grid
+        p = VIEW_PAD
+
+        self.grids[idx] = 0
+        self.grids[idx, :, :, 0] = OBJECT_TO_IDX['wall']
+        self.grids[idx, :, :, 1] = COLOR_TO_IDX['grey']
+        self.grids[idx, p:p+grid.width, p:p+grid.height] = grid.encode()
+
+        self.contents[idx] = 0
+        for j in range(0, grid.height):
+            for i in range(0, grid.width):
+                v = grid.get(i, j)
+                if v is not None and v.contains is not None:
+                    self.contents[idx, p+i, p+j] = v.contains.encode()
+
+        self.agent_pos[idx] = env.agent_pos
+        self.agent_dir[idx] = env.agent_dir
+        self.carrying[idx] = 0
+        self.carrying_contents[idx] = 0
+        self.step_count[idx] = 0
+        self.max_steps[idx] = env.max_steps
+        self.missions[idx] = env.mission
+
+    def reset(self):
+        for idx in range(0, self.num_envs):
+            self._reset_env(idx)
+        return self.gen_obs()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs,)
+
+        n = np.arange(self.num_envs)
+
+        self.step_count += 1
+
+        reward = np.zeros(shape=(self.num_envs,), dtype=np.float64)
+        done = np.zeros(shape=(self.num_envs,), dtype=np.bool)
+
+        # Contents of the cell in front of each agent
+        fwd_pos = self.agent_pos + DIR_VEC[self.agent_dir]
+        fx = fwd_pos[:, 0] + VIEW_PAD
+        fy = fwd_pos[:, 1] + VIEW_PAD
+        fwd_cell = self.grids[n, fx, fy]
+        fwd_type = fwd_cell[:, 0]
+        fwd_state = fwd_cell[:, 2]
+
+        # Rotate left and right
+        left = actions == self.actions.left
+        self.agent_dir[left] = (self.agent_dir[left] - 1) % 4
+        right = actions == self.actions.right
+        self.agent_dir[right] = (self.agent_dir[right] + 1) % 4
+
+        # Move forward
+        forward = actions == self.actions.forward
+        move = forward & CAN_OVERLAP[fwd_type, fwd_state]
+        self.agent_pos[move] = fwd_pos[move]
+        goal = forward & (fwd_type == OBJECT_TO_IDX['goal'])
+        done |= goal
+        reward[goal] = 1 - 0.9 * (self.step_count[goal] / self.max_steps[goal])
+
+        # Pick up an object
+        pickup = actions == self.actions.pickup
+        pickup &= CAN_PICKUP[fwd_type, fwd_state] & (self.carrying[:, 0] == 0)
+        k = n[pickup]
+        self.carrying[k] = fwd_cell[k]
+        self.carrying_contents[k] = self.contents[k, fx[k], fy[k]]
+        self.grids[k, fx[k], fy[k]] = 0
+        self.contents[k, fx[k], fy[k]] = 0
+
+        # Drop an object
+        drop = actions == self.actions.drop
+        drop &= (fwd_type == 0) & (self.carrying[:, 0] != 0)
+        k = n[drop]
+        self.grids[k, fx[k], fy[k]] = self.carrying[k]
+        self.contents[k, fx[k], fy[k]] = self.carrying_contents[k]
+        self.carrying[k] = 0
+        self.carrying_contents[k] = 0
+
+        # Toggle/activate an object
+        toggle = actions == self.actions.toggle
+
+        # Doors are opened or closed
+        k = n[toggle & (fwd_type == OBJECT_TO_IDX['door'])]
+        self.grids[k, fx[k], fy[k], 2] = 1 - fwd_state[k]
+
+        # Locked doors are unlocked with a key of the same color,
+        # which is used up
+        unlock = toggle & (fwd_type == OBJECT_TO_IDX['locked_door'])
+        unlock &= self.carrying[:, 0] == OBJECT_TO_IDX['key']
+        unlock &= self.carrying[:, 1] == fwd_cell[:, 1]
+        k = n[unlock]
+        self.grids[k, fx[k], fy[k], 2] = 1
+        self.carrying[k] = 0
+        self.carrying_contents[k] = 0
+
+        # Boxes are replaced by their contents
+        k = n[toggle & (fwd_type == OBJECT_TO_IDX['box'])]
+        self.grids[k, fx[k], fy[k]] = self.contents[k, fx[k], fy[k]]
+        self.contents[k, fx[k], fy[k]] = 0
+
+        done |= self.step_count >= self.max_steps
+
+        # Start new episodes for the environments which are done
+        for idx in n[done]:
+            self._reset_env(idx)
+
+        obs = self.gen_obs()
+
+        return obs, reward, done, [{} for i in range(self.num_envs)]
+
+    def gen_obs(self):
+        """
+        Generate the agents' views, stacked in the same format as the
+        observations of MiniGridEnv
+        """
+
+        n = np.arange(self.num_envs)
+
+        # Gather the cells in the view of every agent
+        offsets = VIEW_OFFSETS[self.agent_dir]
+        xs = self.agent_pos[:, 0, None, None] + offsets[..., 0] + VIEW_PAD
+        ys = self.agent_pos[:, 1, None, None] + offsets[..., 1] + VIEW_PAD
+        image = self.grids[n[:, None, None], xs, ys]
+
+        agent_pos = (AGENT_VIEW_SIZE // 2, AGENT_VIEW_SIZE - 1)
+
+        # Process occluders and visibility
+        if not self.see_through_walls:
+            opaque = OPAQUE[image[..., 0], image[..., 2]]
+            mask = vis_mask_batch(opaque, agent_pos)
+            image[~mask] = 0
+
+        # Make it so the agents see what they are carrying
+        image[:, agent_pos[0], agent_pos[1]] = self.carrying
+
+        return {
+            'image': image,
+            'direction': self.agent_dir.copy(),
+            'mission': list(self.missions)
+        }
+
+    def render_rgb(self, tile_size=CELL_PIXELS):
+        """
+        Render the whole grids of all environments, as an array of RGB
+        pixel values with shape (num_envs, height, width, 3)
+        """
+
+        from gym_minigrid.tile_rendering import render_batch
+
+        size = self.grid_size
+        codes = self.grids[:, VIEW_PAD:VIEW_PAD+size, VIEW_PAD:VIEW_PAD+size]
+
+        return render_batch(codes, self.agent_pos, self.agent_dir, tile_size)
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+class VecMiniBlocksEnv:
+    """
+    Steps a batch of block world environments at once.
+
+    This is the counterpart of VecMiniGridEnv for MiniBlocksEnv and its
+    subclasses (eg: BlockMaze): actions are moves in cardinal directions,
+    and blocks are pushed onto free cells, block goals and doors following
+    the rules of MiniBlocksEnv._step. Observations are the fully observable
+    grid encodings, with the agent drawn in the color of each environment
+    (no agent is drawn for the ghost variant).
+
+    Only environments seeing through walls are supported, and the debug
+    messages printed by MiniBlocksEnv when a goal or door is reached are
+    left out.
+    """
+
+    def __init__(self, env_id, num_envs, seed=1337):
+        self.envs = [_make_env(env_id) for i in range(num_envs)]
+        self.num_envs = num_envs
+
+        env = self.envs[0]
+        for e in self.envs:
+            assert isinstance(e, MiniBlocksEnv)
+            assert e.grid_size == env.grid_size, "environments must have the same grid size"
+            assert e.see_through_walls, "only fully observable environments are supported"
+
+        self.actions = env.actions
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+        self.reward_range = env.reward_range
+
+        self.grid_size = env.grid_size
+        size = self.grid_size + 4
+
+        # Grid encodings, including the invisible objects, padded with two
+        # layers of walls so that the cells two steps ahead of the agents
+        # are always inside the arrays
+        self.grids = np.zeros(shape=(num_envs, size, size, 3), dtype='uint8')
+
+        # Agent position in the unpadded grid, and direction
+        self.agent_pos = np.zeros(shape=(num_envs, 2), dtype=int)
+        self.agent_dir = np.zeros(shape=(num_envs,), dtype=int)
+
+        # Color index used to draw each agent, -1 if the agent isn't drawn
+        self.agent_color = np.array([
+            -1 if e.agent_color is None else COLOR_TO_IDX[e.agent_color]
+            for e in self.envs
+        ])
+
+        # Rewards for pushing a block to a goal and onto a door
+        self.block_reward = np.array([e._blockreward() for e in self.envs])
+        self.door_reward = np.array([e._doorreward() for e in self.envs])
+
+        self.step_count = np.zeros(shape=(num_envs,), dtype=int)
+        self.max_steps = np.zeros(shape=(num_envs,), dtype=np.float64)
+
+        self.seed(seed)
+
+    def seed(self, seed=1337):
+        """
+        Seed the environments with consecutive seeds
+        """
+
+        for idx, env in enumerate(self.envs):
+            env.seed(seed + idx)
+        return [seed + idx for idx in range(self.num_envs)]
+
+    def _reset_env(self, idx):
+        """
+        Generate a new level for one environment and load its state
+        """
+
+        env = self.envs[idx]
+        env.reset()
+
+        grid = env.grid
+
+        self.grids[idx] = 0
+        self.grids[idx, :, :, 0] = OBJECT_TO_IDX['wall']
+        self.grids[idx, :, :, 1] = COLOR_TO_IDX['grey']
+        self.grids[idx, 2:2+grid.width, 2:2+grid.height] = grid.encode(render_invisible=True)
+
+        self.agent_pos[idx] = env.agent_pos
+        self.agent_dir[idx] = env.agent_dir
+        self.step_count[idx] = 0
+        self.max_steps[idx] = env.max_steps
+
+    def reset(self):
+        for idx in range(0, self.num_envs):
+            self._reset_env(idx)
+        return self.gen_obs()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs,)
+        assert np.all((actions >= 0) & (actions <= self.actions.none)), "unknown action"
+
+        n = np.arange(self.num_envs)
+
+        self.step_count += 1
+
+        reward = -1.0 / self.max_steps
+        done = np.zeros(shape=(self.num_envs,), dtype=np.bool)
+
+        # Movements are in cardinal directions
+        move = actions != self.actions.none
+        self.agent_dir[move] = actions[move]
+
+        # Contents of the cells one and two steps in front of each agent
+        dir_vec = DIR_VEC[self.agent_dir]
+        fwd_pos = self.agent_pos + dir_vec
+        fx = fwd_pos[:, 0] + 2
+        fy = fwd_pos[:, 1] + 2
+        fx2 = fx + dir_vec[:, 0]
+        fy2 = fy + dir_vec[:, 1]
+        fwd_cell = self.grids[n, fx, fy]
+        fwd_type = fwd_cell[:, 0]
+        fwd2_type = self.grids[n, fx2, fy2, 0]
+
+        walk = move & BLOCKS_CAN_OVERLAP[fwd_type, fwd_cell[:, 2]]
+        to_goal = (fwd2_type == OBJECT_TO_IDX['blockgoal'])
+        to_goal |= (fwd2_type == OBJECT_TO_IDX['visibleblockgoal'])
+
+        # Blocks are pushed onto empty cells, block goals and doors,
+        # which become block doors
+        block = move & (fwd_type == OBJECT_TO_IDX['block'])
+        k = n[block & ((fwd2_type == 0) | to_goal)]
+        self.grids[k, fx2[k], fy2[k]] = fwd_cell[k]
+        k = n[block & (fwd2_type == OBJECT_TO_IDX['door'])]
+        self.grids[k, fx2[k], fy2[k]] = (
+            OBJECT_TO_IDX['blockdoor'], COLOR_TO_IDX['red'], 0
+        )
+        reward[k] = self.door_reward[k]
+        push = block & ((fwd2_type == 0) | to_goal | (fwd2_type == OBJECT_TO_IDX['door']))
+
+        # Block doors are pushed onto empty cells and block goals, leaving
+        # a block and an open door behind them
+        blockdoor = move & (fwd_type == OBJECT_TO_IDX['blockdoor'])
+        blockdoor &= (fwd2_type == 0) | to_goal
+        k = n[blockdoor]
+        self.grids[k, fx2[k], fy2[k]] = (
+            OBJECT_TO_IDX['block'], COLOR_TO_IDX['red'], 0
+        )
+        self.grids[k, fx[k], fy[k]] = (
+            OBJECT_TO_IDX['door'], COLOR_TO_IDX['red'], 1
+        )
+
+        k = n[push]
+        self.grids[k, fx[k], fy[k]] = 0
+
+        # Blocks reaching a goal end the episode
+        block_goal = (block | blockdoor) & to_goal
+        done |= block_goal
+        reward[block_goal] = self.block_reward[block_goal]
+
+        walk |= push | blockdoor
+        self.agent_pos[walk] = fwd_pos[walk]
+
+        # Agent-goal interactions
+        goal = move & (fwd_type == OBJECT_TO_IDX['goal'])
+        done |= goal
+        reward[goal] = 1 - 0.9 * (self.step_count[goal] / self.max_steps[goal])
+
+        done |= self.step_count >= self.max_steps
+
+        # Start new episodes for the environments which are done
+        for idx in n[done]:
+            self._reset_env(idx)
+
+        obs = self.gen_obs()
+
+        return obs, reward, done, [{} for i in range(self.num_envs)]
+
+    def gen_obs(self):
+        """
+        Generate the stacked encodings of the full grids, in the same
+        format as the observations of MiniBlocksEnv
+        """
+
+        size = self.grid_size
+        image = self.grids[:, 2:2+size, 2:2+size].copy()
+        image[INVISIBLE[image[..., 0]]] = 0
+
+        # Draw the agents on top of the cells they occupy
+        k = np.flatnonzero(self.agent_color >= 0)
+        x = self.agent_pos[k, 0]
+        y = self.agent_pos[k, 1]
+        image[k, x, y, 0] = OBJECT_TO_IDX['agent']
+        image[k, x, y, 1] = self.agent_color[k]
+
+        return {
+            'image': image
+        }
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+def _proc_worker(conn, env_id, seed, envs_slice, image_buf, dir_buf, image_shape):
+    """
+    Worker process stepping a slice of the environments of a ProcVecEnv.
+    Observation images and directions are written into the shared buffers,
+    so that only actions, rewards, done flags, infos and the missions of
+    new episodes go through the pipe.
+    """
+
+    images = np.frombuffer(image_buf, dtype='uint8').reshape((-1,) + image_shape)
+    images = images[envs_slice]
+    dirs = np.frombuffer(dir_buf, dtype=np.int64)[envs_slice]
+
+    envs = []
+    for idx in range(envs_slice.start, envs_slice.stop):
+        env = _make_proc_env(env_id)
+        env.seed(seed + idx)
+        envs.append(env)
+
+    def write_obs(idx, obs):
+        images[idx] = obs['image']
+        dirs[idx] = obs.get('direction', 0)
+        return obs.get('mission')
+
+    try:
+        while True:
+            cmd, data = conn.recv()
+
+            if cmd == 'step':
+                rewards = np.zeros(shape=(len(envs),), dtype=np.float64)
+                dones = np.zeros(shape=(len(envs),), dtype=np.bool)
+                infos = []
+                missions = {}
+                for idx, env in enumerate(envs):
+                    obs, rewards[idx], dones[idx], info = env.step(data[idx])
+                    if dones[idx]:
+                        obs = env.reset()
+                        missions[idx] = obs.get('mission')
+                    write_obs(idx, obs)
+                    infos.append(info)
+                conn.send((rewards, dones, infos, missions))
+
+            elif cmd == 'reset':
+                missions = {}
+                for idx, env in enumerate(envs):
+                    missions[idx] = write_obs(idx, env.reset())
+                conn.send(missions)
+
+            elif cmd == 'seed':
+                for idx, env in enumerate(envs):
+                    env.seed(data + envs_slice.start + idx)
+                conn.send(None)
+
+            elif cmd == 'close':
+                for env in envs:
+                    env.close()
+                break
+
+            else:
+                assert False, "unknown command"
+    finally:
+        conn.close()
+
+def _make_proc_env(env_id):
+    """
+    Create an environment from a registered id or a constructor, keeping
+    the wrappers added by gym.make so that episodes match those of scalar
+    environments
+    """
+
+    if callable(env_id):
+        return env_id()
+    return gym.make(env_id)
+
+class ProcVecEnv:
+    """
+    Steps a batch of environments in parallel worker processes.
+
+    Each worker owns a contiguous slice of the environments, steps them
+    with their own step method (so any registered environment is
+    supported, including RoomGrid-based ones) and resets them
+    automatically at the end of each episode. Observation images and
+    directions are written by the workers into shared memory buffers.
+
+    The environment with index i is seeded with seed + i. Level generation
+    only draws from the RNGs of the environments, so the levels don't
+    depend on the number of workers.
+    """
+
+    def __init__(self, env_id, num_envs, num_workers=None, seed=1337):
+        if num_workers is None:
+            num_workers = mp.cpu_count()
+        num_workers = max(1, min(num_workers, num_envs))
+
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+
+        # Read the spaces and observation format from a local instance
+        # of the environment
+        env = _make_proc_env(env_id)
+        self.actions = env.unwrapped.actions
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+        self.reward_range = env.reward_range
+        obs = env.reset()
+        self.has_direction = 'direction' in obs
+        self.has_mission = 'mission' in obs
+        env.close()
+
+        self.image_shape = self.observation_space.spaces['image'].shape
+
+        image_size = int(np.prod(self.image_shape))
+        image_buf = mp.RawArray('B', num_envs * image_size)
+        dir_buf = mp.RawArray('b', num_envs * 8)
+        self.images = np.frombuffer(image_buf, dtype='uint8').reshape((num_envs,) + self.image_shape)
+        self.directions = np.frombuffer(dir_buf, dtype=np.int64)
+        self.missions = [None] * num_envs
+
+        # Split the environments into contiguous slices, one per worker
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self.slices = [slice(int(bounds[w]), int(bounds[w+1])) for w in range(num_workers)]
+
+        self.conns = []
+        self.procs = []
+        for s in self.slices:
+            parent_conn, child_conn = mp.Pipe()
+            proc = mp.Process(
+                target=_proc_worker,
+                args=(
+                    child_conn,
+                    env_id,
+                    seed,
+                    s,
+                    image_buf,
+                    dir_buf,
+                    self.image_shape
+                ),
+                daemon=True
+            )
+            proc.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.procs.append(proc)
+
+        self.closed = False
+
+    def seed(self, seed=1337):
+        """
+        Seed the environments with consecutive seeds
+        """
+
+        for conn in self.conns:
+            conn.send(('seed', seed))
+        for conn in self.conns:
+            conn.recv()
+        return [seed + idx for idx in range(self.num_envs)]
+
+    def reset(self):
+        for conn in self.conns:
+            conn.send(('reset', None))
+        for s, conn in zip(self.slices, self.conns):
+            self._set_missions(s, conn.recv())
+        return self.gen_obs()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs,)
+
+        for s, conn in zip(self.slices, self.conns):
+            conn.send(('step', actions[s]))
+
+        rewards = np.zeros(shape=(self.num_envs,), dtype=np.float64)
+        dones = np.zeros(shape=(self.num_envs,), dtype=np.bool)
+        infos = []
+        for s, conn in zip(self.slices, self.conns):
+            rewards[s], dones[s], worker_infos, missions = conn.recv()
+            infos += worker_infos
+            self._set_missions(s, missions)
+
+        return self.gen_obs(), rewards, dones, infos
+
+    def _set_missions(self, s, missions):
+        for idx, mission in missions.items():
+            self.missions[s.start + idx] = mission
+
+    def gen_obs(self):
+        """
+        Copy the observations written by the workers, stacked in the same
+        format as the observations of the environments
+        """
+
+        obs = {
+            'image': self.images.copy()
+        }
+        if self.has_direction:
+            obs['direction'] = self.directions.copy()
+        if self.has_mission:
+            obs['mission'] = list(self.missions)
+        return obs
+
+    def close(self):
+        if self.closed:
+            return
+        for conn in self.conns:
+            conn.send(('close', None))
+        for proc in self.procs:
+            proc.join()
+        self.closed = True
@@ -7,32 +7,118 @@ import numpy as np
 import gym
 from gym import error, spaces, utils
 
+from gym_minigrid.minigrid import AGENT_VIEW_SIZE
+from gym_minigrid.tile_rendering import render_batch
+
+class CountTable:
+    """
+    Table of visit counts, stored in a preallocated array indexed by
+    tuples of integers or, if shape is None, in a dict keyed by state
+    hashes.
+
+    If decay is set, all counts are multiplied by it at every update.
+    Counts are stored divided by the product of the decay factors so far,
+    so that decaying them doesn't need to touch the whole table.
+    """
+
+    def __init__(self, shape=None, decay=None):
+        self.shape = shape
+        self.decay = decay
+        self.reset()
+
+    def reset(self):
+        if self.shape is None:
+            self.counts = {}
+        else:
+            self.counts = np.zeros(shape=self.shape, dtype=np.float64)
+        self.scale = 1.0
+
+    def _decay(self):
+        if self.decay is None:
+            return
+
+        self.scale *= self.decay
+
+        # Fold the scale back into the counts before it underflows
+        if self.scale < 1e-100:
+            if self.shape is None:
+                for key in self.counts:
+                    self.counts[key] *= self.scale
+            else:
+                self.counts *= self.scale
+            self.scale = 1.0
+
+    def increment(self, key):
+        """
+        Count a visit of key, returning the new count
+        """
+
+        self._decay()
+
+        count = self.counts.get(key, 0) if self.shape is None else self.counts[key]
+        count += 1 / self.scale
+        self.counts[key] = count
+
+        return count * self.scale
+
+    def increment_batch(self, index):
+        """
+        Count visits of distinct array entries, given as a tuple of index
+        arrays, returning the new counts
+        """
+
+        assert self.shape is not None
+
+        self._decay()
+
+        counts = self.counts[index] + 1 / self.scale
+        self.counts[index] = counts
+
+        return counts * self.scale
+
+    def reset_entries(self, index):
+        """
+        Clear the counts of a subset of the table (eg: one environment)
+        """
+
+        self.counts[index] = 0
+
 class ActionBonus(gym.core.Wrapper):
     """
     Wrapper which adds an exploration bonus.
     This is a reward to encourage exploration of less
     visited (state,action) pairs.
+
+    States are the agent position and direction, or with key='state', the
+    full state of the environment (see MiniGridEnv.state_hash). Counts can
+    decay over time (decay < 1) and be cleared at the start of every
+    episode (reset_counts=True).
     """
 
-    def __init__(self, env):
+    def __init__(self, env, decay=None, reset_counts=False, key='position'):
         super().__init__(env)
-        self.counts = {}
+        assert key in ('position', 'state')
+
+        self.key = key
+        self.reset_counts = reset_counts
+
+        grid_size = self.unwrapped.grid_size
+        num_actions = self.unwrapped.action_space.n
+        shape = None if key == 'state' else (grid_size, grid_size, 4, num_actions)
+        self.counts = CountTable(shape, decay)
 
     def step(self, action):
 
         obs, reward, done, info = self.env.step(action)
 
         env = self.unwrapped
-        tup = (env.agentPos, env.agentDir, action)
-
-        # Get the count for this (s,a) pair
-        preCnt = 0
-        if tup in self.counts:
-            preCnt = self.counts[tup]
+        if self.key == 'state':
+            tup = (env.state_hash(), action)
+        else:
+            tup = (env.agent_pos[0], env.agent_pos[1], env.agent_dir, action)
 
         # Update the count for this (s,a) pair
-        newCnt = preCnt + 1
-        self.counts[tup] = newCnt
+        newCnt = self.counts.increment(tup)
 
         bonus = 1 / math.sqrt(newCnt)
 
@@ -40,15 +126,32 @@ class ActionBonus(gym.core.Wrapper):
 
         return obs, reward, done, info
 
+    def reset(self, **kwargs):
+        if self.reset_counts:
+            self.counts.reset()
+        return self.env.reset(**kwargs)
+
 class StateBonus(gym.core.Wrapper):
     """
     Adds an exploration bonus based on which positions
     are visited on the grid.
+
+    With key='state', the full state of the environment is used instead
+    of the agent position (see MiniGridEnv.state_hash). Counts can decay
+    over time (decay < 1) and be cleared at the start of every episode
+    (reset_counts=True).
     """
 
-    def __init__(self, env):
+    def __init__(self, env, decay=None, reset_counts=False, key='position'):
         super().__init__(env)
-        self.counts = {}
+        assert key in ('position', 'state')
+
+        self.key = key
+        self.reset_counts = reset_counts
+
+        grid_size = self.unwrapped.grid_size
+        shape = None if key == 'state' else (grid_size, grid_size)
+        self.counts = CountTable(shape, decay)
 
     def step(self, action):
 
@@ -57,16 +160,13 @@ class StateBonus(gym.core.Wrapper):
         # Tuple based on which we index the counts
         # We use the position after an update
         env = self.unwrapped
-        tup = (env.agentPos)
-
-        # Get the count for this key
-        preCnt = 0
-        if tup in self.counts:
-            preCnt = self.counts[tup]
+        if self.key == 'state':
+            tup = env.state_hash()
+        else:
+            tup = (env.agent_pos[0], env.agent_pos[1])
 
         # Update the count for this key
-        newCnt = preCnt + 1
-        self.counts[tup] = newCnt
+        newCnt = self.counts.increment(tup)
 
         bonus = 1 / math.sqrt(newCnt)
 
@@ -74,30 +174,128 @@ class StateBonus(gym.core.Wrapper):
 
         return obs, reward, done, info
 
+    def reset(self, **kwargs):
+        if self.reset_counts:
+            self.counts.reset()
+        return self.env.reset(**kwargs)
+
+class VecCountBonus:
+    """
+    Adds count-based exploration bonuses to a VecMiniGridEnv or
+    VecMiniBlocksEnv, with separate counts for each environment.
+
+    With actions=False, the counts are over agent positions, as in
+    StateBonus, and with actions=True, over (position, direction, action)
+    tuples, as in ActionBonus. Counts are updated with the agent state
+    after each step, which for environments reset at the end of an
+    episode is the start of the next episode (whose counts are cleared
+    first if reset_counts is set).
+    """
+
+    def __init__(self, vec_env, actions=False, decay=None, reset_counts=False):
+        self.vec_env = vec_env
+        self.actions = actions
+        self.reset_counts = reset_counts
+
+        self.num_envs = vec_env.num_envs
+        self.action_space = vec_env.action_space
+        self.observation_space = vec_env.observation_space
+
+        shape = (self.num_envs, vec_env.grid_size, vec_env.grid_size)
+        if actions:
+            shape += (4, vec_env.action_space.n)
+        self.counts = CountTable(shape, decay)
+
+    def reset(self):
+        if self.reset_counts:
+            self.counts.reset()
+        return self.vec_env.reset()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        obs, rewards, dones, infos = self.vec_env.step(actions)
+
+        # Environments which were reset start counting from scratch
+        if self.reset_counts:
+            self.counts.reset_entries(dones)
+
+        index = (
+            np.arange(self.num_envs),
+            self.vec_env.agent_pos[:, 0],
+            self.vec_env.agent_pos[:, 1]
+        )
+        if self.actions:
+            index += (self.vec_env.agent_dir, actions)
+
+        counts = self.counts.increment_batch(index)
+        rewards = rewards + 1 / np.sqrt(counts)
+
+        return obs, rewards, dones, infos
+
+    def close(self):
+        self.vec_env.close()
+
+class ObsBuffer:
+    """
+    Preallocated output arrays for observation wrappers, used in turn.
 
-class ImgObsWrapper(gym.core.ObservationWrapper):
+    An array returned by next() is not written to again for the following
+    size - 1 calls, so that many observations can be kept by the caller
+    without being copied (eg: size=2 for (obs, next_obs) pairs). If out is
+    given, that single array is written to at every call instead.
+    """
+
+    def __init__(self, shape, dtype='uint8', size=2, out=None):
+        if out is not None:
+            assert out.shape == tuple(shape) and out.dtype == np.dtype(dtype)
+            self.arrays = [out]
+        else:
+            assert size >= 1
+            self.arrays = [np.zeros(shape=shape, dtype=dtype) for i in range(size)]
+        self.idx = -1
+
+    def next(self):
+        self.idx = (self.idx + 1) % len(self.arrays)
+        return self.arrays[self.idx]
+
+class EnvAttrWrapper:
+    """
+    Mixin giving wrappers read access to the attributes of the wrapped
+    environment (eg: grid_size, agent_pos), which are looked up on every
+    access instead of being copied when the wrapper is created
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'env':
+            raise AttributeError(name)
+        return getattr(self.env, name)
+
+class ImgObsWrapper(EnvAttrWrapper, gym.core.ObservationWrapper):
     """
     Use rgb image as the only observation output
+
+    The images are not copied, and are new arrays at every step.
     """
 
     def __init__(self, env):
         super().__init__(env)
-        self.__dict__.update(vars(env))  # hack to pass values to super wrapper
         self.observation_space = env.observation_space.spaces['image']
 
     def observation(self, obs):
         return obs['image']
 
-class PadImgObsWrapper(gym.core.ObservationWrapper):
+class PadImgObsWrapper(EnvAttrWrapper, gym.core.ObservationWrapper):
     """
     Use rgb image as the only observation output.
 
     Pad to 16x16 if smaller than that.
+
+    The padded images are written into buffer_size preallocated arrays
+    used in turn (or into out if given), see ObsBuffer.
     """
 
-    def __init__(self, env):
+    def __init__(self, env, buffer_size=2, out=None):
         super().__init__(env)
-        self.__dict__.update(vars(env))  # hack to pass values to super wrapper
         self.nw, self.nh, self.nc = env.observation_space.spaces['image'].shape
         new_size = (16, 16, self.nc)
         self.observation_space = spaces.Box(
@@ -106,34 +304,35 @@ class PadImgObsWrapper(gym.core.ObservationWrapper):
             shape=new_size,
             dtype='uint8'
         )
-        self.padded = np.zeros(new_size)
+        # Only the image area is written, the padding stays zero
+        self.buffer = ObsBuffer(new_size, 'uint8', buffer_size, out)
+        if out is not None:
+            out[:] = 0
 
     def observation(self, obs):
-        orig_image = obs['image']
-        self.padded[0:self.nw, 0:self.nh, :] = orig_image
-        return self.padded
+        padded = self.buffer.next()
+        padded[0:self.nw, 0:self.nh, :] = obs['image']
+        return padded
 
-class BatchWrapper(gym.core.ObservationWrapper):
+class BatchWrapper(EnvAttrWrapper, gym.core.ObservationWrapper):
     """
     Pad to add extra index at front for batches.
-    """
 
-    def __init__(self, env):
-        super().__init__(env)
-        self.__dict__.update(vars(env))  # hack to pass values to super wrapper
+    The images are views of the images in the observations of the
+    wrapped environment.
+    """
 
     def observation(self, obs):
         orig_image = obs['image']
         return orig_image[None,:,:,:]
 
-class FullyObsWrapper(gym.core.ObservationWrapper):
+class FullyObsWrapper(EnvAttrWrapper, gym.core.ObservationWrapper):
     """
     Fully observable gridworld
     """
 
     def __init__(self, env):
         super().__init__(env)
-        self.__dict__.update(vars(env))  # hack to pass values to super wrapper
         self.observation_space = spaces.Box(
             low=0,
             high=255,
@@ -142,18 +341,83 @@ class FullyObsWrapper(gym.core.ObservationWrapper):
         )
 
     def observation(self, obs):
-        if self.env.grid_render is None:
-            return np.zeros(shape=self.observation_space.shape)  # dark screen as init state?
-        return self.env.grid_render.getArray()
+        return self.unwrapped.render_rgb()
 
 
+class RGBImgObsWrapper(EnvAttrWrapper, gym.core.ObservationWrapper):
+    """
+    Replace the image in the observations with an RGB rendering of the
+    whole grid, with tile_size pixels per cell, updated at every step.
+
+    The images are written into buffer_size preallocated arrays used in
+    turn (or into out if given), see ObsBuffer.
+    """
+
+    def __init__(self, env, tile_size=8, highlight=True, buffer_size=2, out=None):
+        super().__init__(env)
+        self.tile_size = tile_size
+        self.highlight = highlight
+
+        size = env.unwrapped.grid_size * tile_size
+        shape = (size, size, 3)
+        self.observation_space = spaces.Dict(dict(
+            env.observation_space.spaces,
+            image=spaces.Box(low=0, high=255, shape=shape, dtype='uint8')
+        ))
+        self.buffer = ObsBuffer(shape, 'uint8', buffer_size, out)
+
+    def observation(self, obs):
+        image = self.unwrapped.render_rgb(
+            self.tile_size,
+            self.highlight,
+            self.buffer.next()
+        )
+        return dict(obs, image=image)
+
+class RGBImgPartialObsWrapper(EnvAttrWrapper, gym.core.ObservationWrapper):
+    """
+    Replace the image in the observations with an RGB rendering of the
+    agent's view, with tile_size pixels per cell and the agent at the
+    bottom facing up.
+
+    The images are written into buffer_size preallocated arrays used in
+    turn (or into out if given), see ObsBuffer.
+    """
+
+    def __init__(self, env, tile_size=8, buffer_size=2, out=None):
+        super().__init__(env)
+        self.tile_size = tile_size
+
+        size = AGENT_VIEW_SIZE * tile_size
+        shape = (size, size, 3)
+        self.observation_space = spaces.Dict(dict(
+            env.observation_space.spaces,
+            image=spaces.Box(low=0, high=255, shape=shape, dtype='uint8')
+        ))
+        self.buffer = ObsBuffer(shape, 'uint8', buffer_size, out)
+
+    def observation(self, obs):
+        image = self.buffer.next()
+        render_batch(
+            obs['image'][None],
+            (AGENT_VIEW_SIZE // 2, AGENT_VIEW_SIZE - 1),
+            3,
+            self.tile_size,
+            out=image[None]
+        )
+        return dict(obs, image=image)
+
 class FlatObsWrapper(gym.core.ObservationWrapper):
     """
     Encode mission strings using a one-hot scheme,
     and combine these with observed images into one flat array
+
+    The flat arrays are written into buffer_size preallocated uint8 arrays
+    used in turn (or into out if given), see ObsBuffer. The one-hot
+    encoding of the mission is only written when it changes.
     """
 
-    def __init__(self, env, maxStrLen=64):
+    def __init__(self, env, maxStrLen=64, buffer_size=2, out=None):
         super().__init__(env)
 
         self.maxStrLen = maxStrLen
@@ -161,6 +425,7 @@ class FlatObsWrapper(gym.core.ObservationWrapper):
 
         imgSpace = env.observation_space.spaces['image']
         imgSize = reduce(operator.mul, imgSpace.shape, 1)
+        self.imgSize = imgSize
 
         self.observation_space = spaces.Box(
             low=0,
@@ -169,6 +434,16 @@ class FlatObsWrapper(gym.core.ObservationWrapper):
             dtype='uint8'
         )
 
+        self.buffer = ObsBuffer(
+            (imgSize + self.numCharCodes * self.maxStrLen,),
+            'uint8',
+            buffer_size,
+            out
+        )
+
+        # Mission string encoded in each of the output arrays
+        self.bufferStrs = [None] * len(self.buffer.arrays)
+
         self.cachedStr = None
         self.cachedArray = None
 
@@ -179,11 +454,11 @@ class FlatObsWrapper(gym.core.ObservationWrapper):
         # Cache the last-encoded mission string
         if mission != self.cachedStr:
             assert len(mission) <= self.maxStrLen, "mission string too long"
-            mission = mission.lower()
+            lowered = mission.lower()
 
-            strArray = np.zeros(shape=(self.maxStrLen, self.numCharCodes), dtype='float32')
+            strArray = np.zeros(shape=(self.maxStrLen, self.numCharCodes), dtype='uint8')
 
-            for idx, ch in enumerate(mission):
+            for idx, ch in enumerate(lowered):
                 if ch >= 'a' and ch <= 'z':
                     chNo = ord(ch) - ord('a')
                 elif ch == ' ':
@@ -192,8 +467,14 @@ class FlatObsWrapper(gym.core.ObservationWrapper):
                 strArray[idx, chNo] = 1
 
             self.cachedStr = mission
-            self.cachedArray = strArray
+            self.cachedArray = strArray.reshape(-1)
+
+        # Write the image through a view, as it may not be contiguous
+        out = self.buffer.next()
+        out[:self.imgSize].reshape(image.shape)[:] = image
 
-        obs = np.concatenate((image.flatten(), self.cachedArray.flatten()))
+        if self.bufferStrs[self.buffer.idx] != mission:
+            out[self.imgSize:] = self.cachedArray
+            self.bufferStrs[self.buffer.idx] = mission
 
-        return obs
+        return out
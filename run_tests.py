@@ -4,7 +4,7 @@ import random
 import numpy as np
 import gym
 from gym_minigrid.register import env_list
-from gym_minigrid.minigrid import Grid
+from gym_minigrid.minigrid import Grid, MiniGridEnv
 
 # Test specifically importing a specific environment
 from gym_minigrid.envs import DoorKeyEnv
@@ -89,3 +89,928 @@ for i in range(0, 500):
 
 #############################################################################
 
+
+##############################################################################
+
+print('testing array grid storage')
+
+from gym_minigrid.minigrid import ArrayGrid
+
+for envName in env_list:
+    env1 = gym.make(envName)
+    env2 = gym.make(envName)
+    env2.unwrapped.grid_storage = 'array'
+
+    for i in range(0, 3):
+        env1.seed(1337 + i)
+        obs1 = env1.reset()
+        env2.seed(1337 + i)
+        obs2 = env2.reset()
+        assert isinstance(env2.unwrapped.grid, ArrayGrid)
+        assert env1.unwrapped.grid == env2.unwrapped.grid
+
+        for j in range(0, 50):
+            action = random.randint(0, env1.action_space.n - 1)
+            obs1, reward1, done1, _ = env1.step(action)
+            obs2, reward2, done2, _ = env2.step(action)
+            assert np.array_equal(obs1['image'], obs2['image'])
+            assert reward1 == reward2 and done1 == done2
+            if done1:
+                break
+
+    env1.close()
+    env2.close()
+
+##############################################################################
+
+print('testing cached grid encoding')
+
+from gym_minigrid.minigrid import Door
+
+for grid_class in [Grid, ArrayGrid]:
+    env = gym.make('MiniGrid-RedBlueDoors-6x6-v0').unwrapped
+    if grid_class is ArrayGrid:
+        env.grid = ArrayGrid.from_grid(env.grid)
+    door_pos = [
+        (i, j)
+        for j in range(0, env.grid.height)
+        for i in range(0, env.grid.width)
+        if isinstance(env.grid.get(i, j), Door)
+    ][0]
+    door = env.grid.get(*door_pos)
+
+    # The encoding must be refreshed after the door is toggled
+    before = env.grid.encode()
+    door.toggle(env, door_pos)
+    after = env.grid.encode()
+    assert before[door_pos][2] == 0 and after[door_pos][2] == 1
+
+    # Views of the cached encoding are read-only
+    view = env.grid.encode(copy=False)
+    assert not view.flags.writeable
+    assert np.array_equal(view, after)
+
+##############################################################################
+
+print('testing observation encoding fast path')
+
+for envName in env_list:
+    env = gym.make(envName).unwrapped
+    if env.gen_obs.__func__ is not MiniGridEnv.gen_obs:
+        continue
+
+    for i in range(0, 100):
+        image, vis_mask = env.gen_obs_encoding()
+        grid, vis_mask2 = env.gen_obs_grid()
+        assert np.array_equal(image, grid.encode())
+        assert np.array_equal(vis_mask, vis_mask2)
+
+        action = random.randint(0, env.action_space.n - 1)
+        obs, reward, done, info = env.step(action)
+        if done:
+            env.reset()
+
+##############################################################################
+
+print('testing visibility mask')
+
+from gym_minigrid.minigrid import vis_mask
+
+def process_vis_reference(opaque, agent_pos):
+    width, height = opaque.shape
+    mask = np.zeros(shape=(width, height), dtype=bool)
+    mask[agent_pos[0], agent_pos[1]] = True
+
+    for j in reversed(range(1, height)):
+        for i in range(0, width-1):
+            if not mask[i, j] or opaque[i, j]:
+                continue
+            mask[i+1, j] = True
+            mask[i+1, j-1] = True
+            mask[i, j-1] = True
+
+        for i in reversed(range(1, width)):
+            if not mask[i, j] or opaque[i, j]:
+                continue
+            mask[i-1, j-1] = True
+            mask[i-1, j] = True
+            mask[i, j-1] = True
+
+    return mask
+
+rng = np.random.RandomState(1337)
+for i in range(0, 2000):
+    width = rng.randint(1, 20)
+    height = rng.randint(1, 20)
+    opaque = rng.uniform(size=(width, height)) < rng.uniform()
+    agent_pos = (rng.randint(width), rng.randint(height))
+    mask = vis_mask(opaque, agent_pos)
+    assert np.array_equal(mask, process_vis_reference(opaque, agent_pos))
+
+# Rows wider than 64-bit integers
+for width in [62, 63, 64, 100]:
+    opaque = rng.uniform(size=(width, 5)) < 0.1
+    agent_pos = (width // 2, 4)
+    mask = vis_mask(opaque, agent_pos)
+    assert mask.dtype == bool
+    assert np.array_equal(mask, process_vis_reference(opaque, agent_pos))
+
+##############################################################################
+
+print('testing vectorized environment')
+
+from gym_minigrid.vecenv import VecMiniGridEnv
+
+for envName in [
+    'MiniGrid-Empty-8x8-v0',
+    'MiniGrid-DoorKey-6x6-v0',
+    'MiniGrid-FourRooms-v0',
+    'MiniGrid-MultiRoom-N6-v0',
+    'MiniGrid-LockedRoom-v0'
+]:
+    num_envs = 4
+    vec_env = VecMiniGridEnv(envName, num_envs, seed=1337)
+    envs = [gym.make(envName) for i in range(num_envs)]
+    for i, env in enumerate(envs):
+        env.seed(1337 + i)
+
+    obs = vec_env.reset()
+    for i, env in enumerate(envs):
+        assert np.array_equal(obs['image'][i], env.reset()['image'])
+
+    for step in range(0, 500):
+        actions = [random.randint(0, vec_env.action_space.n - 1) for i in range(num_envs)]
+        obs, rewards, dones, infos = vec_env.step(actions)
+
+        for i, env in enumerate(envs):
+            env_obs, reward, done, info = env.step(actions[i])
+            if done:
+                env_obs = env.reset()
+            assert np.array_equal(obs['image'][i], env_obs['image'])
+            assert obs['direction'][i] == env_obs['direction']
+            assert obs['mission'][i] == env_obs['mission']
+            assert rewards[i] == reward
+            assert dones[i] == done
+
+##############################################################################
+
+print('testing vectorized block environment')
+
+from gym_minigrid.envs import BlockMazeEnv
+from gym_minigrid.vecenv import VecMiniBlocksEnv
+
+def make_block_maze(agent_color):
+    def make():
+        env = BlockMazeEnv()
+        env.agent_color = agent_color
+        return env
+    return make
+
+for agent_color in ['blue', 'red', None]:
+    num_envs = 4
+
+    # The vectorized environments reset automatically at the end of their
+    # episodes, so both batches of environments are compared over their
+    # first episode
+    vec_env = VecMiniBlocksEnv(make_block_maze(agent_color), num_envs, seed=1337)
+    obs = vec_env.reset()
+
+    envs = [make_block_maze(agent_color)() for i in range(num_envs)]
+    for i, env in enumerate(envs):
+        env.seed(1337 + i)
+        assert np.array_equal(obs['image'][i], env.reset()['image'])
+
+    finished = np.zeros(shape=(num_envs,), dtype=np.bool)
+
+    for step in range(0, int(envs[0].max_steps) - 1):
+        actions = [random.randint(0, vec_env.action_space.n - 1) for i in range(num_envs)]
+        obs, rewards, dones, infos = vec_env.step(actions)
+
+        for i, env in enumerate(envs):
+            if finished[i]:
+                continue
+            env_obs, reward, done, info = env.step(actions[i])
+            assert rewards[i] == reward
+            assert dones[i] == done
+            if done:
+                finished[i] = True
+            else:
+                assert np.array_equal(obs['image'][i], env_obs['image'])
+
+##############################################################################
+
+print('testing multiprocess vectorized environment')
+
+from gym_minigrid.vecenv import ProcVecEnv
+
+for envName in ['MiniGrid-DoorKey-6x6-v0', 'MiniGrid-KeyCorridorS3R1-v0']:
+    num_envs = 4
+    vec_env = ProcVecEnv(envName, num_envs, num_workers=2, seed=1337)
+    envs = [gym.make(envName) for i in range(num_envs)]
+    for i, env in enumerate(envs):
+        env.seed(1337 + i)
+
+    obs = vec_env.reset()
+    for i, env in enumerate(envs):
+        assert np.array_equal(obs['image'][i], env.reset()['image'])
+
+    for step in range(0, 200):
+        actions = [random.randint(0, vec_env.action_space.n - 1) for i in range(num_envs)]
+        obs, rewards, dones, infos = vec_env.step(actions)
+
+        for i, env in enumerate(envs):
+            env_obs, reward, done, info = env.step(actions[i])
+            if done:
+                env_obs = env.reset()
+            assert np.array_equal(obs['image'][i], env_obs['image'])
+            assert obs['direction'][i] == env_obs['direction']
+            assert obs['mission'][i] == env_obs['mission']
+            assert rewards[i] == reward
+            assert dones[i] == done
+
+    vec_env.close()
+
+# Missions are returned by environments without directions
+class NoDirectionWrapper(gym.core.ObservationWrapper):
+    def observation(self, obs):
+        return {'image': obs['image'], 'mission': obs['mission']}
+
+def make_no_direction_env():
+    return NoDirectionWrapper(gym.make('MiniGrid-KeyCorridorS3R1-v0'))
+
+vec_env = ProcVecEnv(make_no_direction_env, 2, num_workers=1, seed=1337)
+obs = vec_env.reset()
+env = make_no_direction_env()
+env.seed(1337)
+assert 'direction' not in obs
+assert obs['mission'][0] == env.reset()['mission']
+vec_env.close()
+
+##############################################################################
+
+print('testing asyncio environment pool')
+
+import asyncio
+from gym_minigrid.asyncpool import AsyncMiniGridPool
+
+num_envs = 4
+pool = AsyncMiniGridPool('MiniGrid-DoorKey-6x6-v0', num_envs, seed=1337)
+envs = [gym.make('MiniGrid-DoorKey-6x6-v0') for i in range(num_envs)]
+for i, env in enumerate(envs):
+    env.seed(1337 + i)
+
+async def run_actor(env_idx):
+    env = envs[env_idx]
+    obs = await pool.reset(env_idx)
+    assert np.array_equal(obs['image'], env.reset()['image'])
+
+    for step in range(0, 100):
+        action = random.randint(0, pool.action_space.n - 1)
+        obs, reward, done, info = await pool.step(env_idx, action)
+        env_obs, env_reward, env_done, env_info = env.step(action)
+        assert np.array_equal(obs['image'], env_obs['image'])
+        assert reward == env_reward and done == env_done
+        if done:
+            obs = await pool.reset(env_idx)
+            assert np.array_equal(obs['image'], env.reset()['image'])
+
+async def run_actors():
+    await asyncio.gather(*[run_actor(i) for i in range(num_envs)])
+
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+loop.run_until_complete(run_actors())
+loop.close()
+
+stats = pool.stats()
+assert stats['queue_depth'] == 0
+assert stats['num_requests'] >= num_envs * 101
+assert stats['num_batches'] < stats['num_requests']
+pool.close()
+
+# Requests fail instead of waiting forever when the batches can't be executed
+pool = AsyncMiniGridPool('MiniGrid-DoorKey-6x6-v0', 2)
+pool.executor.shutdown()
+
+async def run_failing():
+    return await asyncio.gather(pool.reset(0), pool.reset(1), return_exceptions=True)
+
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+errors = loop.run_until_complete(run_failing())
+loop.close()
+assert all(isinstance(e, RuntimeError) for e in errors)
+assert pool.stats()['queue_depth'] == 0
+pool.close()
+
+##############################################################################
+
+print('testing shared world objects')
+
+from copy import copy, deepcopy
+from gym_minigrid.minigrid import Wall, Door, Key, Box
+
+# Stateless tiles are shared, stateful objects are not
+assert Wall.shared() is Wall.shared('grey')
+assert Wall.shared('red') is not Wall.shared()
+try:
+    Door.shared('red')
+    assert False
+except AssertionError as e:
+    assert str(e) != ''
+assert not hasattr(Wall(), '__dict__')
+assert not hasattr(Key(), '__dict__')
+
+grid = Grid(8, 8)
+grid.wall_rect(0, 0, 8, 8)
+grid.set(3, 3, Door('red'))
+grid.set(4, 4, Key('yellow'))
+assert grid.get(0, 0) is grid.get(7, 7)
+
+# Copies keep the shared tiles, and copy the other objects
+grid2 = grid.copy()
+assert grid2 == grid
+assert grid2.get(0, 0) is grid.get(0, 0)
+assert grid2.get(3, 3) is not grid.get(3, 3)
+grid2.get(3, 3).is_open = True
+assert not grid.get(3, 3).is_open
+door = deepcopy(grid.get(3, 3))
+assert door.color == 'red' and door.is_open == False
+
+# Shallow copies reference the attribute values, deep copies copy them
+box = Box('red', Key('blue'))
+assert copy(box) is not box and copy(box).contains is box.contains
+assert deepcopy(box).contains is not box.contains
+assert deepcopy(box).contains.color == 'blue'
+assert copy(Wall.shared()) is Wall.shared()
+
+##############################################################################
+
+print('testing state snapshots')
+
+for envName in ['MiniGrid-DoorKey-8x8-v0', 'MiniGrid-KeyCorridorS3R3-v0', 'MiniGrid-BlockMaze-v0']:
+    env = gym.make(envName).unwrapped
+    env.reset()
+
+    for i in range(0, 20):
+        env.step(random.randint(0, env.action_space.n - 1))
+
+    state = env.get_state()
+    actions = [random.randint(0, env.action_space.n - 1) for i in range(0, 50)]
+
+    def rollout():
+        results = []
+        for action in actions:
+            obs, reward, done, info = env.step(action)
+            results.append((obs['image'], reward, done))
+            if done:
+                break
+        results.append(env.grid.encode(render_invisible=True))
+        return results
+
+    results1 = rollout()
+    env.set_state(state)
+    results2 = rollout()
+
+    assert len(results1) == len(results2)
+    for r1, r2 in zip(results1, results2):
+        for v1, v2 in zip(r1, r2):
+            assert np.array_equal(v1, v2)
+
+    # The state of the RNG is restored too
+    env.set_state(state)
+    r1 = env._rand_int(0, 1000000)
+    env.set_state(state)
+    assert env._rand_int(0, 1000000) == r1
+
+##############################################################################
+
+print('testing state hashing')
+
+for envName in ['MiniGrid-DoorKey-8x8-v0', 'MiniGrid-KeyCorridorS3R3-v0']:
+    env = gym.make(envName).unwrapped
+    env.reset()
+
+    hashes = {}
+    for i in range(0, 300):
+        obs, reward, done, info = env.step(random.randint(0, env.action_space.n - 1))
+        if done:
+            env.reset()
+
+        # The incrementally updated hash matches a full recomputation
+        grid_hash = env.grid.state_hash()
+        grid = env.grid.copy()
+        grid._hash = None
+        assert grid.state_hash() == grid_hash
+        assert grid == env.grid
+
+        # Equal states have equal hashes
+        state = env.get_state()
+        h = env.state_hash()
+        env.step(env.actions.left)
+        assert env.state_hash() != h
+        env.set_state(state)
+        assert env.state_hash() == h
+
+    # Grids differing by a door state have different hashes
+    grid = Grid(6, 6)
+    grid.wall_rect(0, 0, 6, 6)
+    grid.set(2, 2, Door('red'))
+    grid2 = grid.copy()
+    assert grid2.state_hash() == grid.state_hash()
+    grid2.get(2, 2).is_open = True
+    grid2.mark_dirty(2, 2)
+    assert grid2.state_hash() != grid.state_hash()
+    assert grid2 != grid
+
+##############################################################################
+
+print('testing exploration bonuses')
+
+import math
+from gym_minigrid.wrappers import VecCountBonus
+
+for wrapper in [ActionBonus, StateBonus]:
+    for kwargs in [{}, {'decay': 0.99}, {'key': 'state', 'reset_counts': True}]:
+        env = wrapper(gym.make('MiniGrid-DoorKey-6x6-v0'), **kwargs)
+        env.reset()
+        for i in range(0, 200):
+            obs, reward, done, info = env.step(random.randint(0, env.action_space.n - 1))
+            if done:
+                env.reset()
+            else:
+                assert reward > 0 and reward <= 1 + 1e-9
+
+# Turning in place revisits the same position
+env = StateBonus(gym.make('MiniGrid-Empty-8x8-v0'))
+env.reset()
+for i in range(1, 5):
+    obs, reward, done, info = env.step(env.unwrapped.actions.left)
+    assert math.isclose(reward, 1 / math.sqrt(i))
+
+vec_env = VecCountBonus(VecMiniGridEnv('MiniGrid-Empty-8x8-v0', 4), actions=True)
+vec_env.reset()
+for i in range(1, 5):
+    obs, rewards, dones, infos = vec_env.step([vec_env.vec_env.actions.forward] * 4)
+    obs, rewards, dones, infos = vec_env.step([vec_env.vec_env.actions.left] * 4)
+assert np.allclose(rewards, 1)
+vec_env.close()
+
+##############################################################################
+
+print('testing observation wrapper buffers')
+
+env = FlatObsWrapper(gym.make('MiniGrid-DoorKey-6x6-v0'), buffer_size=2)
+obs1 = env.reset()
+obs1_copy = obs1.copy()
+obs2, reward, done, info = env.step(env.unwrapped.actions.left)
+assert obs2 is not obs1
+assert np.array_equal(obs1, obs1_copy)
+assert obs1.dtype == np.uint8
+obs3, reward, done, info = env.step(env.unwrapped.actions.left)
+assert obs3 is obs1
+
+inner_obs = env.unwrapped.gen_obs()
+assert np.array_equal(obs3[:inner_obs['image'].size], inner_obs['image'].flatten())
+assert obs3[inner_obs['image'].size:].sum() == len(inner_obs['mission'])
+
+out = np.zeros(shape=(16, 16, 3), dtype='uint8')
+env = PadImgObsWrapper(gym.make('MiniGrid-DoorKey-6x6-v0'), out=out)
+obs = env.reset()
+assert obs is out
+assert np.array_equal(obs[:7, :7], env.unwrapped.gen_obs()['image'])
+assert env.grid_size == env.unwrapped.grid_size
+
+##############################################################################
+
+print('testing tile rendering')
+
+env = gym.make('MiniGrid-DoorKey-8x8-v0')
+env.seed(1337)
+env.reset()
+img = env.render('rgb_array')
+assert img.shape == (8 * 32, 8 * 32, 3)
+assert img.dtype == np.uint8
+assert np.array_equal(img, env.unwrapped.render_rgb())
+
+# The top-left corner is a wall, drawn grey
+assert np.array_equal(img[16, 16], (100, 100, 100))
+
+# Cells visible to the agent are highlighted
+i, j = env.unwrapped.agent_pos + env.unwrapped.dir_vec
+assert env.unwrapped.get_highlight_mask()[i, j]
+plain = env.unwrapped.render_rgb(highlight=False)
+assert (img[j*32:(j+1)*32, i*32:(i+1)*32] > plain[j*32:(j+1)*32, i*32:(i+1)*32]).all()
+
+# Tiles are drawn at a different scale without changing the layout
+small = env.unwrapped.render_rgb(tile_size=8)
+assert small.shape == (8 * 8, 8 * 8, 3)
+
+env = FullyObsWrapper(gym.make('MiniGrid-DoorKey-8x8-v0'))
+obs = env.reset()
+assert obs.shape == env.observation_space.shape
+
+##############################################################################
+
+print('testing Qt frame arrays')
+
+import gc
+from gym_minigrid.rendering import Renderer
+
+def filled_renderer(color):
+    r = Renderer(64, 48)
+    r.beginFrame()
+    r.fillRect(0, 0, 64, 48, *color)
+    r.endFrame()
+    return r
+
+# Frame arrays keep their image alive once the renderer is gone
+r = filled_renderer((10, 20, 30))
+frame = r.getArray()
+assert frame.shape == (48, 64, 3)
+assert not frame.flags.writeable
+del r
+gc.collect()
+others = [filled_renderer((200, 100, 50)) for i in range(20)]
+assert np.array_equal(frame[5, 5], (10, 20, 30))
+assert np.array_equal(frame[-1, -1], (10, 20, 30))
+
+##############################################################################
+
+print('testing batched tile rendering')
+
+from gym_minigrid.tile_rendering import render_batch
+
+env = gym.make('MiniGrid-DoorKey-8x8-v0')
+env.reset()
+grid = env.unwrapped.grid.encode()
+imgs = render_batch(
+    np.stack([grid, grid]),
+    agent_pos=[env.unwrapped.agent_pos, (1, 1)],
+    agent_dir=[env.unwrapped.agent_dir, 0]
+)
+assert imgs.shape == (2, 8 * 32, 8 * 32, 3)
+assert np.array_equal(imgs[0], env.unwrapped.render_rgb(highlight=False))
+assert not np.array_equal(imgs[0], imgs[1])
+
+# Agent views, with the agent at the bottom facing up
+obs = env.unwrapped.gen_obs()
+out = np.zeros(shape=(1, 7 * 8, 7 * 8, 3), dtype='uint8')
+views = render_batch(obs['image'][None], (3, 6), 3, tile_size=8, out=out)
+assert views is out
+
+vec_env = VecMiniGridEnv('MiniGrid-DoorKey-8x8-v0', 4)
+vec_env.reset()
+imgs = vec_env.render_rgb(tile_size=16)
+assert imgs.shape == (4, 8 * 16, 8 * 16, 3)
+vec_env.close()
+
+##############################################################################
+
+print('testing RGB image observation wrappers')
+
+env = RGBImgObsWrapper(gym.make('MiniGrid-DoorKey-8x8-v0'), tile_size=8)
+obs1 = env.reset()
+assert obs1['image'].shape == env.observation_space.spaces['image'].shape
+assert np.array_equal(obs1['image'], env.unwrapped.render_rgb(tile_size=8))
+image1 = obs1['image'].copy()
+obs2, reward, done, info = env.step(env.unwrapped.actions.left)
+assert obs2['image'] is not obs1['image']
+assert np.array_equal(obs1['image'], image1)
+assert not np.array_equal(obs2['image'], image1)
+
+env = RGBImgPartialObsWrapper(gym.make('MiniGrid-DoorKey-8x8-v0'), tile_size=8)
+obs = env.reset()
+assert obs['image'].shape == (7 * 8, 7 * 8, 3)
+assert obs['image'].dtype == np.uint8
+assert 'mission' in obs
+obs = ImgObsWrapper(env).reset()
+assert obs.shape == (7 * 8, 7 * 8, 3)
+
+##############################################################################
+
+print('testing video recording')
+
+import os
+import tempfile
+from gym_minigrid.recording import VideoRecorderWrapper, load_video
+
+video_dir = tempfile.mkdtemp()
+env = VideoRecorderWrapper(
+    gym.make('MiniGrid-Empty-6x6-v0'),
+    video_dir,
+    episode_interval=2,
+    tile_size=8,
+    queue_size=2
+)
+frames = []
+for episode in range(0, 3):
+    env.reset()
+    frames.append([env.unwrapped.render_rgb(tile_size=8)])
+    for i in range(0, 5):
+        env.step(env.unwrapped.actions.left)
+        frames[-1].append(env.unwrapped.render_rgb(tile_size=8))
+env.close()
+
+assert sorted(os.listdir(video_dir)) == [
+    'episode_000000.frames', 'episode_000000.json',
+    'episode_000002.frames', 'episode_000002.json'
+]
+video = load_video(os.path.join(video_dir, 'episode_000002'))
+assert video.shape == (6, 6 * 8, 6 * 8, 3)
+assert np.array_equal(video, np.stack(frames[2]))
+
+# Writer errors are raised by the wrapper, without losing frame buffers, and
+# the wrapped environment is still closed
+class FailingWriter:
+    def __init__(self, path, fps):
+        pass
+    def append_data(self, frame):
+        raise IOError('disk full')
+    def close(self):
+        pass
+
+env = VideoRecorderWrapper(gym.make('MiniGrid-Empty-6x6-v0'), video_dir, queue_size=2)
+env.writer_cls = FailingWriter
+env.reset()
+# Wait for the writer to fail on the first frame
+env.commands.join()
+try:
+    env.step(env.unwrapped.actions.left)
+    assert False
+except IOError:
+    pass
+assert env.free.qsize() == 2
+# The first frame of the next episode fails again
+env.reset()
+env.commands.join()
+assert env.error is not None
+env.unwrapped.closed = False
+env.unwrapped.close = lambda: setattr(env.unwrapped, 'closed', True)
+try:
+    env.close()
+    assert False
+except IOError:
+    pass
+assert env.unwrapped.closed and not env.thread.is_alive()
+
+##############################################################################
+
+print('testing object placement')
+
+from gym_minigrid.minigrid import Ball
+from gym_minigrid.roomgrid import reject_next_to
+
+env = gym.make('MiniGrid-Empty-6x6-v0').unwrapped
+env.reset()
+assert env.place_sampling == 'rejection'
+env.place_sampling = 'index'
+# The goal is the only object inside the walls
+assert env.grid.empty_mask().sum() == 4 * 4 - 1
+
+# Shared instances are not given the position of the cell they are placed in
+pos = env.place_obj(Wall.shared('red'))
+assert env.grid.get(*pos) is Wall.shared('red')
+assert Wall.shared('red').init_pos is None and Wall.shared('red').cur_pos is None
+env.grid.set(*pos, None)
+ball = Ball()
+pos = env.place_obj(ball)
+assert tuple(ball.init_pos) == tuple(pos) and tuple(ball.cur_pos) == tuple(pos)
+env.grid.set(*pos, None)
+
+# Positions are drawn uniformly among the empty cells accepted by reject_fn
+counts = {}
+for i in range(0, 2000):
+    pos = env.place_obj(None, reject_fn=reject_next_to)
+    assert env.grid.get(*pos) is None
+    assert not reject_next_to(env, pos)
+    counts[tuple(pos)] = counts.get(tuple(pos), 0) + 1
+assert len(counts) == 4 * 4 - 4
+assert min(counts.values()) > 100
+
+# Rejection in non-vectorized filters removes the candidates
+env.place_obj(None, reject_fn=lambda env, pos: pos[0] != 1)
+
+# Filling the grid exhausts the candidates instead of looping forever, once
+# the random positions tried first all fail
+for i in range(0, 4 * 4 - 2):
+    env.place_obj(Ball())
+try:
+    env.place_obj(Ball())
+    assert False
+except RecursionError:
+    pass
+
+# The default rejection sampling reproduces the levels of earlier versions
+env = gym.make('MiniGrid-PutNear-8x8-N3-v0').unwrapped
+env.seed(7)
+env.reset()
+types = env.grid.encode()[:, :, 0]
+objs = sorted(zip(*np.nonzero(types > 1)))
+assert objs == [(2, 1), (3, 5), (6, 5)]
+assert tuple(env.start_pos) == (2, 6)
+
+##############################################################################
+
+print('testing environment RNG')
+
+from gym_minigrid.minigrid import BulkRandom
+
+# Numbers drawn in bulk are the same as those drawn one at a time
+rs1 = np.random.RandomState(42)
+rs2 = BulkRandom(np.random.RandomState(42), block_size=7)
+for i in range(0, 1000):
+    low = i % 5
+    high = low + 1 + (i * 7919) % 1000
+    assert rs1.randint(low, high) == rs2.randint(low, high)
+    assert rs1.uniform(0, 3) == rs2.uniform(0, 3)
+
+# Seeding the environment reproduces the BlockMaze layouts, whatever the
+# state of the global numpy RNG
+np.random.seed(0)
+env = gym.make('MiniGrid-BlockMaze-v0')
+env.seed(3)
+env.reset()
+grid1 = env.unwrapped.grid.encode(render_invisible=True)
+np.random.seed(1)
+env.seed(3)
+env.reset()
+grid2 = env.unwrapped.grid.encode(render_invisible=True)
+assert np.array_equal(grid1, grid2)
+
+##############################################################################
+
+print('testing level pool')
+
+from gym_minigrid.levels import LevelPool
+
+# Levels taken from a pool are those generated by resets of an environment
+# seeded the same way
+for env_name in ['MiniGrid-MultiRoom-N6-v0', 'MiniGrid-KeyCorridorS3R3-v0']:
+    for background in [True, False]:
+        ref = gym.make(env_name)
+        ref.seed(5)
+        env = gym.make(env_name)
+        env.unwrapped.level_pool = LevelPool(env_name, seed=5, size=4, background=background)
+
+        for i in range(0, 8):
+            obs1 = ref.reset()
+            obs2 = env.reset()
+            assert np.array_equal(obs1['image'], obs2['image'])
+            assert obs1['mission'] == obs2['mission']
+            assert np.array_equal(ref.unwrapped.grid.encode(), env.unwrapped.grid.encode())
+
+            # Levels are not modified by the episodes played in them
+            for j in range(0, 10):
+                env.step(env.action_space.sample())
+
+        env.unwrapped.level_pool.close()
+
+# If the generator process dies, the pool keeps producing the same levels
+ref = gym.make('MiniGrid-MultiRoom-N6-v0')
+ref.seed(7)
+pool = LevelPool('MiniGrid-MultiRoom-N6-v0', seed=7, size=2)
+env = gym.make('MiniGrid-MultiRoom-N6-v0')
+env.unwrapped.level_pool = pool
+for i in range(0, 6):
+    if i == 3:
+        pool.proc.terminate()
+        pool.proc.join()
+    ref.reset()
+    env.reset()
+    assert np.array_equal(ref.unwrapped.grid.encode(), env.unwrapped.grid.encode())
+assert pool.proc is None
+pool.close()
+
+##############################################################################
+
+print('testing level library')
+
+from gym_minigrid.minigrid import WorldObj
+from gym_minigrid.levels import LevelLibrary, write_levels
+
+level_path = os.path.join(tempfile.mkdtemp(), 'levels.bin')
+
+# Levels loaded from a library are those generated for their seeds
+for env_name in ['MiniGrid-KeyCorridorS3R3-v0', 'MiniGrid-PutNear-8x8-N3-v0', 'MiniGrid-BlockMaze-v0']:
+    assert write_levels(level_path, env_name, range(20, 30)) == 10
+
+    library = LevelLibrary(level_path, indices=[9, 3, 5], sequential=True)
+    assert len(library) == 3
+    assert list(library.seeds) == [29, 23, 25]
+
+    env = gym.make(env_name)
+    env.unwrapped.level_library = library
+
+    for seed in [29, 23, 25, 29]:
+        ref = gym.make(env_name)
+        ref.seed(seed)
+        ref.reset()
+        env.reset()
+
+        grid1 = ref.unwrapped.grid.encode(render_invisible=True)
+        grid2 = env.unwrapped.grid.encode(render_invisible=True)
+        assert np.array_equal(grid1, grid2)
+        assert ref.unwrapped.mission == env.unwrapped.mission
+
+        for name in env.unwrapped.level_attrs:
+            value1 = getattr(ref.unwrapped, name)
+            value2 = getattr(env.unwrapped, name)
+            if isinstance(value1, WorldObj):
+                assert value2 is env.unwrapped.grid.get(*value1.cur_pos)
+            else:
+                assert np.array_equal(value1, value2)
+
+# Levels can be drawn at random with the RNG of the environment
+write_levels(level_path, 'MiniGrid-PutNear-8x8-N3-v0', range(0, 10))
+env = gym.make('MiniGrid-PutNear-8x8-N3-v0')
+env.unwrapped.level_library = LevelLibrary(level_path)
+env.seed(0)
+missions1 = [env.reset()['mission'] for i in range(0, 10)]
+env.seed(0)
+missions2 = [env.reset()['mission'] for i in range(0, 10)]
+assert missions1 == missions2
+
+try:
+    LevelLibrary(os.path.join(video_dir, 'episode_000000.json'))
+    assert False
+except ValueError:
+    pass
+
+##############################################################################
+
+print('testing grid decoding')
+
+from gym_minigrid.minigrid import OBJECT_TO_IDX, COLOR_TO_IDX, Wall
+
+# Every object type can be decoded
+colors = {'goal': 'green', 'blockgoal': 'green', 'visibleblockgoal': 'green'}
+for obj_type, type_idx in OBJECT_TO_IDX.items():
+    if obj_type == 'empty':
+        continue
+    color = colors.get(obj_type, 'red')
+    code = (type_idx, COLOR_TO_IDX[color], 0)
+    assert WorldObj.decode(*code).encode() == code
+
+# Stateless tiles are shared, and invisible objects stay hidden
+array = np.zeros(shape=(5, 5, 3), dtype='uint8')
+array[0, :] = (OBJECT_TO_IDX['wall'], COLOR_TO_IDX['grey'], 0)
+array[2, 2] = (OBJECT_TO_IDX['blockgoal'], COLOR_TO_IDX['green'], 0)
+array[3, 3] = (OBJECT_TO_IDX['door'], COLOR_TO_IDX['blue'], 1)
+grid = Grid.decode(array)
+assert grid.get(0, 4) is Wall.shared('grey')
+assert grid.get(3, 3).is_open
+assert grid.encode()[2, 2, 0] == 0
+assert np.array_equal(grid.encode(render_invisible=True), array)
+
+# The cached encoding of a decoded grid is the encoding of its objects, so
+# it is the same as the encoding of a copy of the grid
+array = np.zeros(shape=(4, 4, 3), dtype='uint8')
+array[0, 0] = (OBJECT_TO_IDX['agent'], COLOR_TO_IDX['blue'], 1)
+array[1, 0] = (OBJECT_TO_IDX['other'], COLOR_TO_IDX['purple'], 1)
+array[2, 1] = (OBJECT_TO_IDX['key'], COLOR_TO_IDX['red'], 1)
+array[3, 2] = (OBJECT_TO_IDX['ball'], COLOR_TO_IDX['yellow'], 0)
+array[1, 2] = (OBJECT_TO_IDX['door'], COLOR_TO_IDX['purple'], 1)
+array[0, 2] = (OBJECT_TO_IDX['wall'], COLOR_TO_IDX['green'], 0)
+grid = Grid.decode(array)
+assert np.array_equal(grid.encode(), grid.slice(0, 0, 4, 4).encode())
+assert np.array_equal(
+    grid.rotate_left().encode(),
+    Grid.decode(grid.encode()).rotate_left().encode()
+)
+assert grid == grid.slice(0, 0, 4, 4)
+assert grid.encode()[0, 0, 2] == 1
+
+##############################################################################
+
+print('testing agent visibility queries')
+
+from gym_minigrid.minigrid import AGENT_VIEW_SIZE
+
+def decoded_agent_sees(env, x, y):
+    vx, vy = env.get_view_coords(x, y)
+    if vx < 0 or vy < 0 or vx >= AGENT_VIEW_SIZE or vy >= AGENT_VIEW_SIZE:
+        return False
+    obs_cell = Grid.decode(env.gen_obs()['image']).get(vx, vy)
+    return obs_cell is not None and obs_cell.type == env.grid.get(x, y).type
+
+# Cached queries give the same results as decoding a new observation, as
+# the agent moves and opens doors, and when branching from snapshots
+env = gym.make('MiniGrid-KeyCorridorS3R3-v0').unwrapped
+env.seed(0)
+env.reset()
+state = env.get_state()
+for i in range(0, 200):
+    env.step(random.randint(0, env.action_space.n - 1))
+    if i == 100:
+        env.set_state(state)
+
+    objs = [
+        (x, y)
+        for x in range(0, env.grid.width)
+        for y in range(0, env.grid.height)
+        if env.grid.get(x, y) is not None
+    ]
+    seen = [decoded_agent_sees(env, x, y) for x, y in objs]
+    assert [env.agent_sees(x, y) for x, y in objs] == seen
+    assert list(env.agent_sees_many(objs)) == seen